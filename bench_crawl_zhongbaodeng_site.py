@@ -0,0 +1,69 @@
+"""Benchmark the HTML table extraction of `crawl_zhongbaodeng_site`
+
+The lxml/XPath path (`parse_tbl`) is compared with the BeautifulSoup path
+(`parse_tbl_bs4`) on the saved fixture pages. Both must extract the same table.
+
+```bash
+python bench_crawl_zhongbaodeng_site.py -n 200
+python bench_crawl_zhongbaodeng_site.py ~/Downloads/zbd_pages -n 50
+```
+"""
+
+import argparse
+import pathlib
+import time
+from typing import Callable
+
+import pandas as pd
+
+import crawl_zhongbaodeng_site as cz
+
+FIXTURES = pathlib.Path(__file__).parent / "tests" / "fixtures"
+Parser = Callable[[str], pd.DataFrame | None]
+
+
+def bench(parser: Parser, htmls: list[str], n: int) -> float:
+    """the pages parsed per second"""
+    start = time.perf_counter()
+    for _ in range(n):
+        for html in htmls:
+            parser(html)
+    return n * len(htmls) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "folder",
+        nargs="?",
+        default=str(FIXTURES),
+        help="the folder of the saved pages (zbd_*.html), default tests/fixtures",
+    )
+    parser.add_argument(
+        "-n", type=int, default=100, help="parse each page n times (default 100)"
+    )
+    opt = parser.parse_args()
+
+    files = sorted(pathlib.Path(opt.folder).expanduser().glob("zbd_*.html"))
+    if len(files) == 0:
+        raise FileNotFoundError(f"no zbd_*.html page in {opt.folder}")
+    htmls = [x.read_text(encoding="utf-8") for x in files]
+    for html, file in zip(htmls, files):
+        expected = cz.parse_tbl_bs4(html)
+        out = cz.parse_tbl(html)
+        if expected is None or out is None:
+            if expected is not out:
+                raise RuntimeError(f"the parsers disagree on {file.name}")
+            continue
+        pd.testing.assert_frame_equal(out, expected)
+
+    parsers: dict[str, Parser] = {"bs4": cz.parse_tbl_bs4, "lxml": cz.parse_tbl}
+    speeds = {nm: bench(f, htmls, opt.n) for nm, f in parsers.items()}
+    print(f"{len(files)} pages, each parsed {opt.n} times")
+    for nm, speed in speeds.items():
+        ratio = speed / speeds["bs4"]
+        print(f"{nm:>5}: {speed:>10.1f} pages/sec ({ratio:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
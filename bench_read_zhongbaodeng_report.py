@@ -0,0 +1,218 @@
+"""Benchmark the parsing throughput of `read_zhongbaodeng_report.read_tbl`
+
+Synthetic multi-page PDFs are generated in the layout of the 中保登 monthly report,
+i.e., the normal and the money market (货币类) tables, CJK product names with
+unexpected spaces and the garbage watermark strings. No third-party PDF writer is
+needed: the text is drawn with a CID font whose `ToUnicode` map is all that the
+text extraction relies on.
+
+The pages/sec and rows/sec of `read_tbl` are reported for each size, so parser
+changes can be checked for regressions offline.
+
+```bash
+python bench_read_zhongbaodeng_report.py --sizes 10 100 1000 --jobs 1 4
+```
+"""
+
+import argparse
+import pathlib
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import read_zhongbaodeng_report as rp
+
+PROD_TYPES = ["固定收益类", "混合类", "权益类", "货币类"]
+GARBAGE = ["½ö¹©°²Áª×Ê²ú²Î¿¼", "NÅO\x9b[\x89\x80T\x8dDN§O\x7fu("]
+MGRS = ["平安", "大家", "泰康", "国寿", "太平", "人保", "华泰", "新华", "阳光", "长江"]
+WORDS = ["如意", "稳健精选", "安享", "鑫盈", "增利", "优选", "恒盛", "价值增长"]
+
+
+def make_rows(
+    rnd: random.Random, prod_type: str, n: int
+) -> list[tuple[str, list[str]]]:
+    """the product name (with unexpected spaces) and the other fields of n rows"""
+    out = []
+    for _ in range(n):
+        mgr = rnd.choice(MGRS)
+        name = f"{mgr}资产{rnd.choice(WORDS)} {rnd.randint(1, 99)}号"
+        if rnd.random() < 0.3:
+            name += f"(第{rnd.randint(1, 9)}期)"
+        name += rnd.choice(["资产管理产品", "集合资产管理产品"])
+        setup = date(2010, 1, 1) + timedelta(days=rnd.randint(0, 5000))
+        ytd = f"{rnd.uniform(-10, 10):.2f}%"
+        asset = f"{rnd.uniform(0.01, 300):.2f}"
+        mgr_full = f"{mgr}资产管理有限责任公司"
+        if prod_type == "货币类":
+            fields = [setup.strftime("%Y%m%d"), ytd, asset, mgr_full]
+        else:
+            nav = f"{rnd.uniform(0.8, 3):.4f}"
+            mon = rnd.choice([f"{rnd.uniform(-3, 3):.2f}%", "-"])
+            fields = [setup.strftime("%Y%m%d"), nav, mon, ytd, asset, mgr_full]
+        out.append((name, fields))
+    return out
+
+
+def make_lines(rnd: random.Random, prod_type: str, nrows: int) -> list[str]:
+    """the text lines of a page"""
+    if prod_type == "货币类":
+        header = " ".join(rp.COLS[i] for i in [0, 1, 4, 5, 6])
+    else:
+        header = " ".join(rp.COLS[:-1])
+    lines = [f"开放式组合类资管产品清单（{prod_type}）", GARBAGE[0], header]
+    for name, fields in make_rows(rnd, prod_type, nrows):
+        line = " ".join([name] + fields)
+        if rnd.random() < 0.05:
+            line += rnd.choice(GARBAGE)
+        lines.append(line)
+    lines.append(GARBAGE[1])
+    return lines
+
+
+def to_unicode_cmap(chars: set[str]) -> bytes:
+    codes = sorted(f"<{ord(c):04X}>" for c in chars)
+    out = [
+        "/CIDInit /ProcSet findresource begin",
+        "12 dict begin",
+        "begincmap",
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+        "/CMapName /Adobe-Identity-UCS def",
+        "/CMapType 2 def",
+        "1 begincodespacerange",
+        "<0000> <FFFF>",
+        "endcodespacerange",
+    ]
+    # the cid is the code point itself, at most 100 entries in each block
+    for i in range(0, len(codes), 100):
+        block = codes[i : i + 100]
+        out.append(f"{len(block)} beginbfchar")
+        out.extend(f"{x} {x}" for x in block)
+        out.append("endbfchar")
+    out += [
+        "endcmap",
+        "CMapName currentdict /CMap defineresource pop",
+        "end",
+        "end",
+    ]
+    return "\n".join(out).encode()
+
+
+def write_pdf(path: pathlib.Path, pages: list[list[str]]) -> None:
+    """write the text lines of each page into a pdf (only BMP chars are supported)"""
+    chars = {c for page in pages for line in page for c in line}
+    objs: list[bytes] = [b"<< /Type /Catalog /Pages 2 0 R >>", b""]
+    objs.append(
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /SimSun /Encoding /Identity-H "
+        b"/DescendantFonts [4 0 R] /ToUnicode 5 0 R >>"
+    )
+    objs.append(
+        b"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /SimSun "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+        b"/DW 1000 >>"
+    )
+    cmap = to_unicode_cmap(chars)
+    objs.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(cmap), cmap))
+    kids = []
+    for lines in pages:
+        ops = []
+        for i, line in enumerate(lines):
+            txt = line.encode("utf-16-be").hex().upper()
+            ops.append(f"BT /F1 8 Tf 20 {800 - 12 * i} Td <{txt}> Tj ET")
+        stream = "\n".join(ops).encode()
+        objs.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        kids.append(len(objs) + 1)
+        objs.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objs)
+        )
+    refs = " ".join(f"{k} 0 R" for k in kids).encode()
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (refs, len(kids))
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objs):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i + 1, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % x for x in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\n" % (len(objs) + 1)
+    out += b"startxref\n%d\n%%%%EOF\n" % xref
+    path.write_bytes(out)
+
+
+def make_report(path: pathlib.Path, npages: int, nrows: int = 40, seed: int = 0) -> int:
+    """generate a synthetic report pdf and return the number of table rows
+
+    The product types change every few pages, and the 货币类 pages contain the
+    money market table.
+    """
+    rnd = random.Random(seed)
+    pages = []
+    for i in range(npages):
+        prod_type = PROD_TYPES[i * len(PROD_TYPES) // npages]
+        pages.append(make_lines(rnd, prod_type, nrows))
+    write_pdf(path, pages)
+    return npages * nrows
+
+
+def bench(
+    path: pathlib.Path, npages: int, nrows: int, jobs: int = 1, repeat: int = 1
+) -> dict[str, float]:
+    """measure `read_tbl` on the report of `make_report()`"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = rp.read_tbl(path, jobs=jobs)
+        best = min(best, time.perf_counter() - start)
+    if len(df) != nrows:
+        raise RuntimeError(f"{nrows} rows are expected, but {len(df)} are parsed")
+    return {
+        "pages": npages,
+        "jobs": jobs,
+        "seconds": best,
+        "pages/sec": npages / best,
+        "rows/sec": nrows / best,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000],
+        help="the page counts of the synthetic pdfs (default 10 100 1000)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="the `jobs` of `read_tbl` to be measured (default 1)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=1,
+        help="repeat each case and report the best (default 1)",
+    )
+    opt = parser.parse_args()
+
+    print(f"{'pages':>6} {'jobs':>4} {'seconds':>9} {'pages/sec':>10} {'rows/sec':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for npages in opt.sizes:
+            path = pathlib.Path(tmp) / f"report_{npages}.pdf"
+            nrows = make_report(path, npages)
+            for jobs in opt.jobs:
+                x = bench(path, npages, nrows, jobs, opt.repeat)
+                print(
+                    f"{x['pages']:>6} {x['jobs']:>4} {x['seconds']:>9.3f} "
+                    f"{x['pages/sec']:>10.1f} {x['rows/sec']:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
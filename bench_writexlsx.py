@@ -0,0 +1,219 @@
+"""Benchmark the throughput and the memory of `writexlsx.write`
+
+Synthetic frames of mixed columns, i.e., integers, large amounts with NA, NAVs,
+dates, datetimes, CJK product names with NA, ASCII codes and flags, are written
+in each writing mode:
+
+- `default`: the pandas Dataframe in the default (in-memory) mode
+- `streaming`: the pandas Dataframe in the `constant_memory` mode
+- `polars`: the polars Dataframe in the `constant_memory` mode
+
+Each case runs in a fresh process, so the peak RSS of the write can be told
+from the others. The rows/sec and the peak memory are printed and written to a
+JSON report, together with the git commit, so that the runs of different
+commits can be compared with `--baseline`.
+
+```bash
+python bench_writexlsx.py --sizes 1000 100000 1000000 -o bench.json
+python bench_writexlsx.py --sizes 1000 100000 --baseline bench.json
+```
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import pathlib
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import xlsxwriter
+
+import writexlsx
+
+MODES = ["default", "streaming", "polars"]
+MGRS = ["平安", "大家", "泰康", "国寿", "太平", "人保", "华泰", "新华", "阳光", "长江"]
+WORDS = ["如意", "稳健精选", "安享", "鑫盈", "增利", "优选", "恒盛", "价值增长"]
+
+
+def make_frame(nrows: int, seed: int = 0) -> pd.DataFrame:
+    """a frame of mixed numeric, date, CJK string and NA columns"""
+    rnd = np.random.default_rng(seed)
+    prefix = pd.Series([f"{x}资产{y}" for x in MGRS for y in WORDS])
+    name = (
+        prefix[rnd.integers(len(prefix), size=nrows)].reset_index(drop=True)
+        + pd.Series(rnd.integers(1, 100, size=nrows)).astype(str)
+        + "号资产管理产品"
+    )
+    amount = rnd.uniform(-1e6, 1e8, size=nrows)
+    amount[rnd.random(nrows) < 0.1] = np.nan
+    df = pd.DataFrame(
+        {
+            "序号": np.arange(1, nrows + 1),
+            "期末净资产": amount,
+            "单位净值": rnd.uniform(0.8, 3, size=nrows).round(4),
+            "成立日期": pd.Timestamp("2010-01-01")
+            + pd.to_timedelta(rnd.integers(0, 5000, size=nrows), unit="D"),
+            "更新时间": pd.Timestamp("2023-01-01")
+            + pd.to_timedelta(rnd.integers(0, 10**7, size=nrows), unit="s"),
+            "产品名称": name,
+            "产品代码": [f"ZH{x:06d}" for x in range(nrows)],
+            "是否开放": rnd.random(nrows) < 0.5,
+        }
+    )
+    df.loc[rnd.random(nrows) < 0.05, "产品名称"] = None
+    return df
+
+
+def max_rss_mb() -> float:
+    """the peak RSS of this process in MB (`ru_maxrss` is in KB on Linux)"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / (1024 if platform.system() == "Darwin" else 1)
+
+
+def run_case(nrows: int, mode: str, repeat: int = 1) -> dict[str, Any]:
+    """write the frame of `nrows` rows in the `mode` and measure it
+
+    It should be run in a fresh process, or `write_mb` only counts the memory
+    beyond the peak of the earlier cases.
+    """
+    df: pd.DataFrame | pl.DataFrame = make_frame(nrows)
+    if mode == "polars":
+        df = pl.from_pandas(df)
+    before = max_rss_mb()
+    best = float("inf")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "bench.xlsx"
+        for _ in range(repeat):
+            start = time.perf_counter()
+            writexlsx.write(df, path, overwrite=True, streaming=mode != "default")
+            best = min(best, time.perf_counter() - start)
+        size = path.stat().st_size
+    peak = max_rss_mb()
+    return {
+        "mode": mode,
+        "rows": nrows,
+        "cols": df.shape[1],
+        "seconds": best,
+        "rows/sec": nrows / best,
+        "peak_mb": peak,
+        "write_mb": peak - before,
+        "file_mb": size / 1024**2,
+    }
+
+
+def bench(
+    sizes: list[int], modes: list[str], repeat: int = 1, isolate: bool = True
+) -> list[dict[str, Any]]:
+    """run every case, each in a fresh process if `isolate`"""
+    out = []
+    for nrows in sizes:
+        for mode in modes:
+            if not isolate:
+                out.append(run_case(nrows, mode, repeat))
+                continue
+            with concurrent.futures.ProcessPoolExecutor(1) as executor:
+                out.append(executor.submit(run_case, nrows, mode, repeat).result())
+    return out
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=pathlib.Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_report(cases: list[dict[str, Any]]) -> dict[str, Any]:
+    return {
+        "commit": git_commit(),
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "polars": pl.__version__,
+        "xlsxwriter": xlsxwriter.__version__,
+        "cases": cases,
+    }
+
+
+def compare(cases: list[dict[str, Any]], baseline: dict[str, Any]) -> list[str]:
+    """the speed and memory ratios to the cases of the baseline report"""
+    base = {(x["mode"], x["rows"]): x for x in baseline["cases"]}
+    out = []
+    for x in cases:
+        y = base.get((x["mode"], x["rows"]))
+        if y is None:
+            continue
+        speed = x["rows/sec"] / y["rows/sec"]
+        out.append(
+            f"{x['mode']:>9} {x['rows']:>8}: rows/sec x{speed:.2f}, "
+            f"write_mb {y['write_mb']:.1f} -> {x['write_mb']:.1f}"
+        )
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000, 1000000],
+        help="the row counts of the synthetic frames (default 1k 10k 100k 1M)",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=MODES,
+        default=MODES,
+        help="the writing modes to be measured (default all)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=1,
+        help="repeat each case and report the best (default 1)",
+    )
+    parser.add_argument("-o", "--output", help="write the JSON report to the file")
+    parser.add_argument(
+        "--baseline", help="compare with the JSON report of an earlier run"
+    )
+    opt = parser.parse_args()
+
+    print(
+        f"{'mode':>9} {'rows':>8} {'seconds':>9} {'rows/sec':>10} "
+        f"{'peak_mb':>8} {'write_mb':>8}"
+    )
+    cases = []
+    for nrows in opt.sizes:
+        for x in bench([nrows], opt.modes, opt.repeat):
+            cases.append(x)
+            print(
+                f"{x['mode']:>9} {x['rows']:>8} {x['seconds']:>9.3f} "
+                f"{x['rows/sec']:>10.0f} {x['peak_mb']:>8.1f} {x['write_mb']:>8.1f}"
+            )
+    report = make_report(cases)
+    if opt.output:
+        pathlib.Path(opt.output).write_text(json.dumps(report, indent=2))
+    if opt.baseline:
+        baseline = json.loads(pathlib.Path(opt.baseline).read_text())
+        print(f"compared with {baseline.get('commit')}:")
+        print("\n".join(compare(cases, baseline)))
+
+
+if __name__ == "__main__":
+    main()
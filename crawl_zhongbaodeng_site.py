@@ -1,42 +1,85 @@
 """爬取组合类产品登记数据
 主要目的是为了爬取组合类产品的注册登记信息
 具体表单的获取方式，是从网页源代码找到的
-total_page和excel_path分别表示爬取的页面范围和生成的excel地址
+total_page和excel_path分别表示爬取的页面范围和生成的excel地址，
+未指定total_page时，会从首页的分页信息（或二分查找最后一个非空页）自动获取总页数
+指定`--store`时会将爬取结果合并到本地SQLite库中，配合`--incremental`时，
+遇到整页均为已知产品登记编码即停止翻页，日常更新只需请求少数几页
 
 # TODO
 - add verbose argument and use logging to display the message
 """
 import requests
 import bs4
+import lxml.etree
+import lxml.html
 import pandas as pd
 import writexlsx
+import httpclient
 import argparse
 import subprocess
+import pathlib
+import sqlite3
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 
-def read_tbl(page: int) -> pd.DataFrame | None:
-    """Read the table content from ZhongBaoDeng website
+URL = "https://www.zhongbaodeng.com/channel/350b43d4af88460b93ccd46658cf631e.html"
+# the retries are done by `fetch_page()` so that they respect the rate limiter
+CLIENT = httpclient.Client(retries=0)
+COLS: list[str] = ["序号", "产品管理人", "产品登记编码", "产品全称", "登记时间"]
+# the upper bound of the discovered page count, in case the site never returns
+# an empty page (e.g., it serves the last page for any page beyond it)
+MAX_PAGES = 10_000
+
+
+TBL_XPATH = lxml.etree.XPath(
+    '//div[@class="product_content_content product_content_content1"]'
+)
+ROWS_XPATH = lxml.etree.XPath(".//li")
+FIELDS_XPATH = lxml.etree.XPath(".//div")
+
+
+def parse_tbl(html: str) -> pd.DataFrame | None:
+    """Parse the table content of the page
+
+    The list items and their fields are selected by the compiled XPath on the
+    lxml tree, which is much lighter than building the BeautifulSoup tree
+    (see `parse_tbl_bs4()` and `bench_crawl_zhongbaodeng_site.py`).
 
     Args:
-        page (int): which page of the table should be downloaded
+        html (str): the html of the page
 
     Returns:
-        list: each element contains a 5-length row data
+        pd.DataFrame | None: each row contains a 5-length row data, None if
+        the table can't be found
     """
-    url: str = (
-        "https://www.zhongbaodeng.com/channel/" "350b43d4af88460b93ccd46658cf631e.html"
-    )
-    params = {
-        "isChannel": "",
-        "isSelect": "",
-        "type": "",
-        "typeId": "",
-        "keyValue": "",
-        "currentPage": page,
-        "keyword": "",
-    }
-    rsp: requests.Response = requests.post(url=url, params=params, timeout=10)
-    soup = bs4.BeautifulSoup(rsp.text, "lxml")
+    if len(html.strip()) == 0:
+        return None
+    tbl = TBL_XPATH(lxml.html.fromstring(html))
+    if len(tbl) == 0:
+        return None
+    out = []
+    for li in ROWS_XPATH(tbl[0]):
+        divs = FIELDS_XPATH(li)
+        out.append([divs[i].text_content().strip() for i in range(5)])
+    return pd.DataFrame(out, columns=COLS)
+
+
+def parse_tbl_bs4(html: str) -> pd.DataFrame | None:
+    """Parse the table content of the page with BeautifulSoup
+
+    Args:
+        html (str): the html of the page
+
+    Returns:
+        pd.DataFrame | None: each row contains a 5-length row data, None if
+        the table can't be found
+    """
+    soup = bs4.BeautifulSoup(html, "lxml")
     tbl = soup.find(
         "div", attrs={"class": "product_content_content product_content_content1"}
     )
@@ -56,21 +99,394 @@ def read_tbl(page: int) -> pd.DataFrame | None:
                 ele[4].text.strip(),
             ]
         )
-    cols: list[str] = ["序号", "产品管理人", "产品登记编码", "产品全称", "登记时间"]
-    return pd.DataFrame(out, columns=cols)
+    return pd.DataFrame(out, columns=COLS)
+
+
+class RateLimiter:
+    """Space the requests evenly so that no more than `rps` are sent per second
+
+    It's thread-safe. `None` or non-positive `rps` means no limit.
+    """
+
+    def __init__(self, rps: Optional[float] = None) -> None:
+        self.interval = 1.0 / rps if rps is not None and rps > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next = time.monotonic()
+
+    def wait(self) -> None:
+        if self.interval == 0.0:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            start = max(self.next, now)
+            self.next = start + self.interval
+        time.sleep(start - now)
+
+
+class ResponseCache:
+    """The on-disk (SQLite) cache of the fetched pages, keyed by url and page
+
+    The pages older than `ttl` seconds are expired and fetched again, `None`
+    means never expire. It's thread-safe.
+    """
+
+    def __init__(self, path: pathlib.Path, ttl: Optional[float] = None) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        with self.con:
+            self.con.execute(
+                "create table if not exists responses (url text, page integer, "
+                "fetched_at real, html text, primary key (url, page))"
+            )
+
+    def close(self) -> None:
+        self.con.close()
+
+    def get(self, url: str, page: int) -> Optional[str]:
+        sql = "select fetched_at, html from responses where url = ? and page = ?"
+        with self.lock:
+            row = self.con.execute(sql, (url, page)).fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and time.time() - row[0] > self.ttl:
+            return None
+        return row[1]
+
+    def put(self, url: str, page: int, html: str) -> None:
+        sql = "insert or replace into responses values (?, ?, ?, ?)"
+        with self.lock, self.con:
+            self.con.execute(sql, (url, page, time.time(), html))
+
+
+def is_transient(e: requests.RequestException) -> bool:
+    """whether retrying may help, i.e., connection errors, timeouts, 429 and 5xx
+
+    The other client errors (e.g., 404/403) fail the same way again.
+    """
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if e.response is None:
+        return False
+    return e.response.status_code == 429 or e.response.status_code >= 500
+
+
+def fetch_page(
+    page: int,
+    url: str = URL,
+    retries: int = 0,
+    backoff: float = 1.0,
+    limiter: Optional[RateLimiter] = None,
+    client: Optional[httpclient.Client] = None,
+    cache: Optional[ResponseCache] = None,
+) -> str:
+    """Fetch the html of the page, retry with exponential backoff on the transient
+    failures, see `is_transient()`
+
+    Args:
+        page (int): which page of the table should be downloaded
+        url (str, optional): the url of the table. Defaults to URL.
+        retries (int, optional): the max number of retries. Defaults to 0.
+        backoff (float, optional): the seconds to wait before the first retry, it
+        doubles after each retry. Defaults to 1.0.
+        limiter (Optional[RateLimiter], optional): the rate limiter shared among
+        the threads. Defaults to None.
+        client (Optional[httpclient.Client], optional): the pooled client whose
+        connections are reused. Defaults to None, means `CLIENT`.
+        cache (Optional[ResponseCache], optional): the unexpired page is replayed
+        from the cache without any request, and the fetched page is saved into it
+        if the table is found.
+        Defaults to None.
+
+    Returns:
+        str: the html text
+    """
+    if cache is not None and (html := cache.get(url, page)) is not None:
+        return html
+    params = {
+        "isChannel": "",
+        "isSelect": "",
+        "type": "",
+        "typeId": "",
+        "keyValue": "",
+        "currentPage": page,
+        "keyword": "",
+    }
+    if client is None:
+        client = CLIENT
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.wait()
+        try:
+            rsp: requests.Response = client.post(url, params=params)
+            rsp.raise_for_status()
+            # e.g., a maintenance notice served with 200 mustn't be replayed
+            if cache is not None and parse_tbl(rsp.text) is not None:
+                cache.put(url, page, rsp.text)
+            return rsp.text
+        except requests.RequestException as e:
+            if attempt >= retries or not is_transient(e):
+                raise
+            wait = backoff * 2**attempt
+            print(f"fetching page {page} failed ({e}), retry in {wait:.1f}s")
+            time.sleep(wait)
+            attempt += 1
+
+
+def read_tbl(
+    page: int, url: str = URL, client: Optional[httpclient.Client] = None
+) -> pd.DataFrame | None:
+    """Read the table content from ZhongBaoDeng website
+
+    Args:
+        page (int): which page of the table should be downloaded
+        url (str, optional): the url of the table. Defaults to URL.
+        client (Optional[httpclient.Client], optional): the pooled client. Defaults
+        to None, means `CLIENT`.
+
+    Returns:
+        pd.DataFrame | None: each row contains a 5-length row data
+    """
+    return parse_tbl(fetch_page(page, url, client=client))
+
+
+def read_tbls(
+    pages: list[int],
+    jobs: int = 1,
+    rps: Optional[float] = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+    url: str = URL,
+    client: Optional[httpclient.Client] = None,
+    cache: Optional[ResponseCache] = None,
+) -> list[pd.DataFrame | None]:
+    """Read the table content of the pages concurrently
+
+    Args:
+        pages (list[int]): the pages to be downloaded
+        jobs (int, optional): the max number of concurrent requests. Defaults to 1.
+        rps (Optional[float], optional): the max requests per second. Defaults to
+        None, means no limit.
+        retries (int, optional): the max number of retries of each page. Defaults
+        to 3.
+        backoff (float, optional): the seconds to wait before the first retry.
+        Defaults to 1.0.
+        url (str, optional): the url of the table. Defaults to URL.
+        client (Optional[httpclient.Client], optional): the pooled client shared
+        among the threads, its pool size should be no less than `jobs`. Defaults
+        to None, means a new client is created for the pages.
+        cache (Optional[ResponseCache], optional): the response cache. Defaults to
+        None.
+
+    Returns:
+        list[pd.DataFrame | None]: the tables in the order of `pages`
+    """
+    limiter = RateLimiter(rps)
+    jobs = max(jobs, 1)
+    own_client = client is None
+    if client is None:
+        client = httpclient.Client(pool_size=jobs, retries=0)
+
+    def read(page: int) -> pd.DataFrame | None:
+        print(f"fetching page {page}")
+        html = fetch_page(page, url, retries, backoff, limiter, client, cache)
+        return parse_tbl(html)
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(read, pages))
+    finally:
+        if own_client:
+            client.close()
+
+
+# the pager markup, e.g., `共 123 页` or `totalPage = 123` in the script
+PAGER_PATTERNS = [r"共\s*(\d+)\s*页", r"""totalPages?\s*[=:]\s*['"]?(\d+)"""]
+
+
+def parse_total_page(html: str) -> Optional[int]:
+    """find the total page count from the pager markup, None if not found"""
+    for pattern in PAGER_PATTERNS:
+        if (match := re.search(pattern, html)) is not None:
+            return int(match.group(1))
+    return None
+
+
+def find_total_page(
+    retries: int = 3,
+    limiter: Optional[RateLimiter] = None,
+    url: str = URL,
+    client: Optional[httpclient.Client] = None,
+    cache: Optional[ResponseCache] = None,
+    max_pages: int = MAX_PAGES,
+) -> tuple[int, dict[int, pd.DataFrame | None]]:
+    """Discover the total page count
+
+    It's read from the pager markup of the first page. When the markup is
+    missing, the last non-empty page is found by galloping (1, 2, 4, 8...) and
+    then binary search, which takes about `2 * log2(n)` requests. The search
+    stops at `max_pages`.
+
+    A site may also serve its last page for any page beyond it, so a probe that
+    returns the same products as the previous probe is past the end too, and
+    the last page is the first one that returns these products.
+
+    Returns:
+        tuple[int, dict[int, pd.DataFrame | None]]: the total page count and the
+        tables fetched during the discovery, so they don't need to be fetched again
+    """
+    fetched: dict[int, pd.DataFrame | None] = {}
+
+    def fetch(page: int) -> tuple[str, Optional[tuple[str, ...]]]:
+        """the html and the product codes of the page, `None` if it's empty"""
+        html = fetch_page(page, url, retries, 1.0, limiter, client, cache)
+        tbl = parse_tbl(html)
+        fetched[page] = tbl
+        if tbl is None or len(tbl) == 0:
+            return (html, None)
+        return (html, tuple(tbl["产品登记编码"]))
+
+    html, codes = fetch(1)
+    total = parse_total_page(html)
+    if total is not None:
+        return (total, fetched)
+    if codes is None:
+        return (0, fetched)
+    # the products of the last page once the site is found serving it beyond the end
+    tail: Optional[tuple[str, ...]] = None
+    prev, lo, hi = 0, 1, 2
+    while hi <= max_pages:
+        probe = fetch(hi)[1]
+        if probe is None:
+            break
+        if probe == codes:
+            # both `lo` and `hi` serve the last page, which is after `prev`
+            tail, lo, hi = probe, prev, lo
+            break
+        prev, lo, hi, codes = lo, hi, hi * 2, probe
+    hi = min(hi, max_pages + 1)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        probe = fetch(mid)[1]
+        if probe is not None and probe != tail:
+            lo = mid
+        else:
+            hi = mid
+    if tail is not None:
+        # `hi` is the first page that serves the products of the last page
+        lo = hi
+    elif lo == max_pages:
+        print(f"the page count reaches the limit of {max_pages} pages")
+    for page in [x for x in fetched if x > lo]:
+        del fetched[page]
+    return (lo, fetched)
+
+
+def crawl(
+    total_page: Optional[int] = None,
+    jobs: int = 1,
+    rps: Optional[float] = None,
+    retries: int = 3,
+    url: str = URL,
+    client: Optional[httpclient.Client] = None,
+    cache: Optional[ResponseCache] = None,
+) -> pd.DataFrame:
+    """Fetch all the pages, the total page count is discovered if not provided"""
+    fetched: dict[int, pd.DataFrame | None] = {}
+    if total_page is None:
+        limiter = RateLimiter(rps)
+        total_page, fetched = find_total_page(retries, limiter, url, client, cache)
+        print(f"there're {total_page} pages in total")
+    pages = [x for x in range(1, total_page + 1) if x not in fetched]
+    tbls = read_tbls(pages, jobs, rps, retries, url=url, client=client, cache=cache)
+    fetched.update(zip(pages, tbls))
+    out = [fetched[x] for x in range(1, total_page + 1)]
+    out = [x for x in out if x is not None]
+    if len(out) == 0:
+        return pd.DataFrame(columns=COLS)
+    return pd.concat(out, ignore_index=True)
+
+
+class Store:
+    """The local SQLite store of the crawled products, keyed by `产品登记编码`"""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.con = sqlite3.connect(path)
+        with self.con:
+            self.con.execute(
+                "create table if not exists products (seq text, manager text, "
+                "code text primary key, name text, reg_date text)"
+            )
+
+    def close(self) -> None:
+        self.con.close()
+
+    def known(self, codes: list[str]) -> set[str]:
+        """the codes that are already in the store"""
+        sql = "select code from products where code in ({})"
+        sql = sql.format(",".join("?" * len(codes)))
+        return {x[0] for x in self.con.execute(sql, codes)}
+
+    def merge(self, tbl: pd.DataFrame) -> None:
+        """insert the rows, the existing codes are updated"""
+        sql = "insert or replace into products values (?, ?, ?, ?, ?)"
+        with self.con:
+            self.con.executemany(sql, tbl[COLS].itertuples(index=False))
+
+    def read(self) -> pd.DataFrame:
+        """all the products, the latest registered first"""
+        sql = "select * from products order by reg_date desc, code desc"
+        return pd.DataFrame(self.con.execute(sql).fetchall(), columns=COLS)
+
+
+def crawl_incremental(
+    store: Store,
+    total_page: Optional[int] = None,
+    jobs: int = 1,
+    rps: Optional[float] = None,
+    retries: int = 3,
+    url: str = URL,
+    client: Optional[httpclient.Client] = None,
+) -> int:
+    """Fetch the pages from the first one until a whole page is already known
+
+    The new registrations only appear on the first pages, so it stops paging as
+    soon as a page contains only known codes (or is empty). The pages are fetched
+    `jobs` at a time and the new rows are merged into the store.
+
+    Returns:
+        int: the number of new products
+    """
+    nnew = 0
+    page = 1
+    while total_page is None or page <= total_page:
+        pages = list(range(page, page + max(jobs, 1)))
+        if total_page is not None:
+            pages = [x for x in pages if x <= total_page]
+        tbls = read_tbls(pages, jobs, rps, retries, url=url, client=client)
+        for tbl in tbls:
+            if tbl is None or len(tbl) == 0:
+                return nnew
+            codes = list(tbl["产品登记编码"])
+            fresh = tbl[~tbl["产品登记编码"].isin(store.known(codes))]
+            store.merge(fresh)
+            nnew += len(fresh)
+            if len(fresh) == 0:
+                return nnew
+        page += len(pages)
+    return nnew
 
 
 def main() -> None:
-    zbdurl = (
-        "https://www.zhongbaodeng.com/channel/" "350b43d4af88460b93ccd46658cf631e.html"
-    )
+    zbdurl = URL
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-p",
         "--pages",
         type=int,
-        help="the total pages to be downloaded (check the website by yourself), "
-        "must be positive.",
+        help="the total pages to be downloaded, must be positive. It's discovered "
+        "from the website if not provided.",
     )
     parser.add_argument(
         "-o",
@@ -91,6 +507,54 @@ def main() -> None:
         default=False,
         help="open the 中保登组合类产品登记网页: " f"{zbdurl} ",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="the max number of concurrent requests (default 1)",
+    )
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=None,
+        help="the max number of requests per second (default no limit)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="the max number of retries with exponential backoff (default 3)",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="the SQLite file that keeps all the crawled products, the fetched rows "
+        "are merged into it and the excel contains all the products in it",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="stop paging once a whole page contains only the products known by "
+        "`--store` (`--pages` is optional then)",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default=None,
+        help="the SQLite file that caches the fetched pages, so a re-run replays "
+        "the cached pages and only fetches the missing or expired ones "
+        "(not used in the incremental mode, which must see the latest pages)",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=24.0,
+        help="the hours before a cached page expires (default 24)",
+    )
     parser.add_argument("outfile", help="the excel file to store the result")
     opt = parser.parse_args()
 
@@ -100,20 +564,38 @@ def main() -> None:
 
     outfile = opt.outfile
     total_page = opt.pages
-    if total_page is None:
-        raise ValueError("`pages` param is not provided")
-    if total_page < 1:
+    if opt.incremental and opt.store is None:
+        raise ValueError("`store` param is required in the incremental mode")
+    if total_page is not None and total_page < 1:
         raise ValueError(
             f"`pages` parameter must be positive integer (now is {total_page})!"
         )
 
-    out: list[pd.DataFrame] = []
-    for i in range(1, total_page):
-        print(f"fetching page {i}")
-        r = read_tbl(i)
-        if r is not None:
-            out.append(r)
-    tbl: pd.DataFrame = pd.concat(out, ignore_index=True)
+    client = httpclient.Client(pool_size=max(opt.jobs, 1), retries=0)
+    store = None if opt.store is None else Store(pathlib.Path(opt.store).expanduser())
+    cache = None
+    if opt.cache is not None:
+        cache = ResponseCache(pathlib.Path(opt.cache).expanduser(), opt.ttl * 3600)
+    try:
+        if store is not None and opt.incremental:
+            nnew = crawl_incremental(
+                store, total_page, opt.jobs, opt.rps, opt.retries, client=client
+            )
+            print(f"{nnew} new products are found")
+        else:
+            tbl = crawl(
+                total_page, opt.jobs, opt.rps, opt.retries, client=client, cache=cache
+            )
+            if store is not None:
+                store.merge(tbl)
+        if store is not None:
+            tbl = store.read()
+    finally:
+        if store is not None:
+            store.close()
+        if cache is not None:
+            cache.close()
+    print(client.stats())
     writexlsx.write(
         {"组合类产品": tbl}, outfile, open=opt.open, overwrite=opt.overwrite
     )
@@ -4,6 +4,10 @@ import requests
 import json
 import pandas as pd
 import os
+from typing import Optional
+import httpclient
+
+CLIENT = httpclient.Client()
 
 
 def rsc_key() -> str:
@@ -14,7 +18,9 @@ def rsc_key() -> str:
     return key
 
 
-def read_db(con: str, sql: str) -> pd.DataFrame:
+def read_db(
+    con: str, sql: str, client: Optional[httpclient.Client] = None
+) -> pd.DataFrame:
     key: str = rsc_key()
     url: str = "http://icube.allianziamc.com.cn/sql-api/db_read"
     headers: dict[str, str] = {
@@ -22,9 +28,9 @@ def read_db(con: str, sql: str) -> pd.DataFrame:
         "Authorization": f"Key {key}",
     }
     data: dict[str, str] = {"con": con, "sql": sql}
-    ret: requests.Response = requests.post(
-        url=url, data=data, headers=headers, timeout=10
-    )
+    if client is None:
+        client = CLIENT
+    ret: requests.Response = client.post(url, data=data, headers=headers)
     if ret.status_code == 200:
         out = pd.DataFrame(json.loads(ret.text))
         return out
@@ -37,3 +43,4 @@ if __name__ == "__main__":
     sql = "select * from pq.idb_param_hs_fund where rownum <= 10"
     df = read_db("pqread", sql)
     print(df)
+    print(CLIENT.stats())
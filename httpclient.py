@@ -0,0 +1,129 @@
+"""## Shared HTTP client for the network scripts
+A pooled `requests.Session` so that repeated requests to the same host reuse the
+TCP/TLS connections instead of setting up a new one each time.
+
+## Main Feature
+1. Keep-alive connection pool with configurable size (set it to the number of
+   threads when the client is shared among threads)
+1. Retry with exponential backoff on connection errors and 429/5xx responses
+1. Default timeout for every request
+1. Optional response compression (gzip/deflate)
+1. Per-request latency and connection-reuse counts for diagnostics
+
+## Example
+```python
+client = httpclient.Client(pool_size=4, retries=3)
+rsp = client.post(url, data=data)
+print(client.stats())
+```
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+@dataclass
+class Stats:
+    requests: int
+    connections: int
+    seconds: float
+
+    @property
+    def reused(self) -> int:
+        """the number of requests sent over an existing connection"""
+        return max(self.requests - self.connections, 0)
+
+    @property
+    def latency(self) -> float:
+        """the mean seconds per request"""
+        return self.seconds / self.requests if self.requests > 0 else float("nan")
+
+    def __str__(self) -> str:
+        return (
+            f"{self.requests} requests over {self.connections} connections "
+            f"({self.reused} reused), mean latency {self.latency:.3f}s"
+        )
+
+
+class Client:
+    """A thin wrapper of the pooled `requests.Session`
+
+    Args:
+        pool_size (int, optional): the max number of kept-alive connections per
+        host. Defaults to 10.
+        retries (int, optional): the max number of retries on connection errors
+        and 429/5xx responses, 0 means no retry. Defaults to 3.
+        backoff (float, optional): the backoff factor of the retries, the waiting
+        seconds are `backoff * 2 ** (n - 1)`. Defaults to 0.5.
+        timeout (float, optional): the default timeout in seconds. Defaults to 10.
+        compress (bool, optional): accept gzip/deflate compressed responses.
+        Defaults to True.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 10.0,
+        compress: bool = True,
+    ) -> None:
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None,  # POST is retried as well
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.session.headers["Accept-Encoding"] = (
+            "gzip, deflate" if compress else "identity"
+        )
+        self.lock = threading.Lock()
+        self.nrequests = 0
+        self.seconds = 0.0
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.nrequests += 1
+                self.seconds += elapsed
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Stats:
+        """the counts of requests and new connections made by the pools"""
+        pools = self.adapter.poolmanager.pools
+        connections = sum(pools[key].num_connections for key in pools.keys())
+        with self.lock:
+            return Stats(self.nrequests, connections, self.seconds)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *args: Optional[Any]) -> None:
+        self.close()
@@ -1,6 +1,7 @@
 """## Read Nav from Excels (估值表)
 读取国内常见估值表的*估值日期、单位净值和累计单位净值*三则信息。
 需要将估值表Excel放置在一个文件夹中，程序会遍历文件夹中所有的Excel表。
+文件夹中的zip压缩包（或直接传入zip压缩包）会在内存中读取，无需解压到磁盘。
 要求Excel表的格式大体一致。
 
 ### 解析原理
@@ -8,6 +9,9 @@
 - `净值日期`：读取特定列的前n行，会自动根据`%Y-%m-%d`或%Y年%m月%d日信息去解析，
 返回第一个成功解析的日期。
 - `单位净值`和`累计单位净值`，根据第一列的字符信息，找到第二列的净值。
+- 同一托管人的估值表格式固定。首次解析成功后，会按表头指纹记住日期和净值所在的行，
+之后相同指纹的估值表直接读取这些单元格，校验失败时才回退到全表扫描。
+指定`--layouts`可将学到的格式保存到json文件，供下次运行使用。
 
 结果会输出到Excel表中。
 
@@ -17,16 +21,35 @@
 python read_nav_from_excel.py ~/Downloads/excels ~/Downloads/nav-data.xlsx --overwrite
 ```
 
+持续监控文件夹，解析新放入的估值表（写入中的文件会等待其稳定后再解析），
+结果写入Parquet或SQLite，并可同时刷新Excel快照：
+
+```bash
+python read_nav_from_excel.py ~/Downloads/excels ~/Downloads/nav-data.xlsx \\
+    --watch --store ~/Downloads/nav-data.parquet --overwrite
+```
+
 """
 import pandas as pd
 import pathlib
 from datetime import date, datetime
-from dataclasses import dataclass, astuple
+from dataclasses import dataclass, astuple, asdict, field
 import re
 import argparse
-from typing import Optional
+from typing import IO, Iterator, Optional
 import logging
 import subprocess
+import hashlib
+import json
+import io
+import zipfile
+import os
+import time
+import threading
+import sqlite3
+import ctypes
+import ctypes.util
+from contextlib import closing
 
 
 @dataclass
@@ -36,24 +59,30 @@ class Nav:
     nav_acc: float
 
 
-def find_nav(
-    indexes: list[str], values: list[str], nms: tuple[str, str]
-) -> tuple[float, float]:
-    nav = None
-    nav_acc = None
-    for index, value in zip(indexes, values):
+def locate_nav(indexes: list[str], nms: tuple[str, str]) -> tuple[int, int]:
+    """Find the row positions of the nav and accumulative nav in the first column"""
+    nav_i = None
+    nav_acc_i = None
+    for i, index in enumerate(indexes):
         if re.search(nms[0], index) is not None:
-            nav = float(value)
+            nav_i = i
         if re.search(nms[1], index) is not None:
-            nav_acc = float(value)
-        if nav is not None and nav_acc is not None:
-            return (nav, nav_acc)
+            nav_acc_i = i
+        if nav_i is not None and nav_acc_i is not None:
+            return (nav_i, nav_acc_i)
     nms_cand = list(filter(lambda x: re.search("净值", x) is not None, indexes))
     raise LookupError(
         f"Can't find {nms} in the first column, possible names {nms_cand}"
     )
 
 
+def find_nav(
+    indexes: list[str], values: list[str], nms: tuple[str, str]
+) -> tuple[float, float]:
+    nav_i, nav_acc_i = locate_nav(indexes, nms)
+    return (float(values[nav_i]), float(values[nav_acc_i]))
+
+
 def parse_date(x: str) -> Optional[date]:
     match = re.search(r"(\d{4})[-年](\d{2})[-月](\d{2})日?", x)
     if match:
@@ -63,16 +92,109 @@ def parse_date(x: str) -> Optional[date]:
         return None
 
 
+@dataclass
+class Layout:
+    """The row positions where the date and navs are found in a valuation table"""
+
+    date_row: int
+    nav_row: int
+    nav_acc_row: int
+
+
+Layouts = dict[str, Layout]
+
+
+def fingerprint(content: pd.DataFrame) -> str:
+    """A cheap fingerprint of the header region of the valuation table
+
+    The digits are masked so that tables of different dates (in the same
+    layout) share the same fingerprint.
+    """
+    header = "|".join(map(str, content.columns))
+    return hashlib.md5(re.sub(r"\d", "#", header).encode()).hexdigest()
+
+
+def scan_nav(
+    content: pd.DataFrame, date_rgs: tuple[int, int], nav_nms: tuple[str, str]
+) -> tuple[Nav, Layout]:
+    ref_date = None
+    date_row = -1
+    for date_rg in range(date_rgs[0]):
+        cell = str(content.iloc[date_rg])
+        logging.debug(f"the date range content is: {cell}")
+        ref_date = parse_date(cell)
+        if ref_date is not None:
+            date_row = date_rg
+            break
+    if ref_date is None:
+        raise LookupError(f"Fail to find ref_date in {date_rgs} cells")
+    indexes = list(content.iloc[:, 0].astype(str))
+    values = list(content.iloc[:, 1].astype(str))
+    nav_row, nav_acc_row = locate_nav(indexes, nav_nms)
+    nav = Nav(ref_date, float(values[nav_row]), float(values[nav_acc_row]))
+    return (nav, Layout(date_row, nav_row, nav_acc_row))
+
+
+def read_layout(
+    content: pd.DataFrame, layout: Layout, nav_nms: tuple[str, str]
+) -> Optional[Nav]:
+    """Read the nav from the known cells, returns None if validation fails"""
+    nrow = len(content)
+    if max(layout.date_row, layout.nav_row, layout.nav_acc_row) >= nrow:
+        return None
+    ref_date = parse_date(str(content.iloc[layout.date_row]))
+    if ref_date is None:
+        return None
+    if re.search(nav_nms[0], str(content.iat[layout.nav_row, 0])) is None:
+        return None
+    if re.search(nav_nms[1], str(content.iat[layout.nav_acc_row, 0])) is None:
+        return None
+    try:
+        nav = float(str(content.iat[layout.nav_row, 1]))
+        nav_acc = float(str(content.iat[layout.nav_acc_row, 1]))
+    except ValueError:
+        return None
+    return Nav(ref_date, nav, nav_acc)
+
+
+def parse_nav(
+    content: pd.DataFrame,
+    date_rgs: tuple[int, int],
+    nav_nms: tuple[str, str],
+    layouts: Optional[Layouts] = None,
+) -> Nav:
+    """Parse Nav data from the content of the valuation table
+
+    When `layouts` is provided, the known cells of the same fingerprint are
+    read directly, and it falls back to the full scan only when the validation
+    fails. The learned layout is stored back into `layouts`.
+    """
+    if layouts is None:
+        return scan_nav(content, date_rgs, nav_nms)[0]
+    key = fingerprint(content)
+    layout = layouts.get(key)
+    if layout is not None:
+        nav = read_layout(content, layout, nav_nms)
+        if nav is not None:
+            logging.debug(f"read by the known layout {key}: {layout}")
+            return nav
+        logging.debug(f"the known layout {key} fails, fall back to full scan")
+    nav, layouts[key] = scan_nav(content, date_rgs, nav_nms)
+    return nav
+
+
 def read_nav(
-    excel: pathlib.Path,
+    excel: pathlib.Path | IO[bytes],
     date_rgs: tuple[int, int],
     nav_nms: tuple[str, str],
     sheet: str | int = 0,
+    layouts: Optional[Layouts] = None,
 ) -> Nav:
     """Read Nav data from Excel (估值表)
 
     Args:
-        excel (pathlib.Path): Must be an existing excel
+        excel (pathlib.Path | IO[bytes]): Must be an existing excel or the
+        file-like object of the excel content
         date_rgs (tuple[int, int]): The range to search for ref_date of navs.
         Program will search such `0:date_rgs[0], date_rgs[1]` area and return
         the first valid date. It tries to find the date by searching the pattern
@@ -80,6 +202,8 @@ def read_nav(
         nav_nms (tuple[str, str]): The row names that marked the nav and accumulative
         nav.
         sheet (str | int, optional): The sheet to search for. Defaults to 0.
+        layouts (Layouts, optional): The learned layouts keyed by the header
+        fingerprint. The known cells are read directly if provided. Defaults to None.
 
     Raises:
         LookupError: It raise exception with searched area or potential row names, when
@@ -90,19 +214,19 @@ def read_nav(
     """
     logging.debug(f"Parsing `{excel}...`")
     content: pd.DataFrame = pd.read_excel(excel, sheet_name=sheet)
-    ref_date = None
-    for date_rg in range(date_rgs[0]):
-        cell = str(content.iloc[date_rg])
-        logging.debug(f"the date range content is: {cell}")
-        ref_date = parse_date(cell)
-        if ref_date is not None:
-            break
-    if ref_date is None:
-        raise LookupError(f"Fail to find ref_date in {date_rgs} cells")
-    indexes = list(content.iloc[:, 0].astype(str))
-    values = list(content.iloc[:, 1].astype(str))
-    navs = find_nav(indexes, values, nav_nms)
-    return Nav(ref_date, navs[0], navs[1])
+    return parse_nav(content, date_rgs, nav_nms, layouts)
+
+
+def load_layouts(x: pathlib.Path) -> Layouts:
+    if not x.exists():
+        return {}
+    with open(x, encoding="utf-8") as f:
+        return {k: Layout(**v) for k, v in json.load(f).items()}
+
+
+def save_layouts(layouts: Layouts, x: pathlib.Path) -> None:
+    with open(x, "w", encoding="utf-8") as f:
+        json.dump({k: asdict(v) for k, v in layouts.items()}, f, indent=2)
 
 
 def to_path(x: str) -> pathlib.Path:
@@ -112,43 +236,328 @@ def to_path(x: str) -> pathlib.Path:
     return out
 
 
-def find_all_excels(x: str) -> list[pathlib.Path]:
+EXCEL_SUFFIXES = [".xlsx", ".xls"]
+
+
+@dataclass(frozen=True)
+class ZipMember:
+    """An Excel stored in a zip archive, it's read in memory without extraction"""
+
+    archive: pathlib.Path
+    member: str
+
+    @property
+    def name(self) -> str:
+        return pathlib.PurePosixPath(self.member).name
+
+    def __str__(self) -> str:
+        return f"{self.archive}/{self.member}"
+
+
+Excel = pathlib.Path | ZipMember
+
+
+def find_zip_excels(archive: pathlib.Path) -> list[ZipMember]:
+    out = []
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            member = pathlib.PurePosixPath(info.filename)
+            if info.is_dir() or member.name.startswith("."):
+                continue
+            if "__MACOSX" in member.parts:
+                continue
+            if member.suffix in EXCEL_SUFFIXES:
+                out.append(ZipMember(archive, info.filename))
+    return out
+
+
+def find_all_excels(x: str) -> list[Excel]:
+    """Find the Excels in a directory or a zip archive
+
+    The zip archives in the directory are searched as well. Their members are
+    returned as `ZipMember` and will be read in memory.
+    """
     dir = pathlib.Path(x).expanduser()
+    if dir.is_file() and dir.suffix == ".zip":
+        return sorted(find_zip_excels(dir), key=str)
     if not dir.exists() or not dir.is_dir():
-        raise FileNotFoundError(f"{x} is not a valid directory")
-    out = []
+        raise FileNotFoundError(f"{x} is not a valid directory or zip archive")
+    out: list[Excel] = []
     for f in dir.iterdir():
-        if f.is_file() and f.suffix in [".xlsx", ".xls"]:
+        if f.is_file() and f.suffix in EXCEL_SUFFIXES:
             out.append(f)
-    out.sort()
+        elif f.is_file() and f.suffix == ".zip":
+            out.extend(find_zip_excels(f))
+    out.sort(key=str)
     return out
 
 
+def iter_contents(
+    excels: list[Excel],
+) -> Iterator[tuple[Excel, pathlib.Path | io.BytesIO]]:
+    """Yield each Excel with the object that can be passed to `pd.read_excel()`
+
+    The zip members are read into memory. The archive is kept open while its
+    members are consecutive so the central directory is parsed only once.
+    """
+    zf: Optional[zipfile.ZipFile] = None
+    try:
+        for excel in excels:
+            if isinstance(excel, ZipMember):
+                if zf is None or zf.filename != str(excel.archive):
+                    if zf is not None:
+                        zf.close()
+                    zf = zipfile.ZipFile(excel.archive)
+                yield (excel, io.BytesIO(zf.read(excel.member)))
+            else:
+                yield (excel, excel)
+    finally:
+        if zf is not None:
+            zf.close()
+
+
 def read_navs(
-    excels: list[pathlib.Path],
+    excels: list[Excel],
     date_rgs: tuple[int, int],
     nav_nms: tuple[str, str],
     sheet: str | int = 0,
+    layouts: Optional[Layouts] = None,
 ) -> pd.DataFrame:
+    if layouts is None:
+        layouts = {}
     out = []
-    for i, excel in enumerate(excels):
+    for i, (excel, content) in enumerate(iter_contents(excels)):
         logging.info(f"Parsing {i+1} of {len(excels)}, {excel.name}...")
-        nav = read_nav(excel, date_rgs=date_rgs, nav_nms=nav_nms, sheet=sheet)
+        nav = read_nav(
+            content, date_rgs=date_rgs, nav_nms=nav_nms, sheet=sheet, layouts=layouts
+        )
         logging.debug(f"nav is {nav}")
         out.append(astuple(nav))
-    cols = ["净值日期", "单位净值", "累计单位净值"]
-    df = pd.DataFrame(out, columns=cols)
+    df = pd.DataFrame(out, columns=NAV_COLS)
     df = df.sort_values("净值日期")
     return df
 
 
+NAV_COLS = ["净值日期", "单位净值", "累计单位净值"]
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x2, 0x8, 0x80, 0x100
+
+
+def start_inotify(folder: pathlib.Path, wake: threading.Event) -> bool:
+    """Set `wake` whenever a file in `folder` is created, written or moved in
+
+    It uses Linux inotify via libc. False is returned when inotify is not available,
+    and the caller should rely on polling only.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return False
+    if fd < 0:
+        return False
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    if libc.inotify_add_watch(fd, str(folder).encode(), mask) < 0:
+        os.close(fd)
+        return False
+
+    def loop() -> None:
+        while os.read(fd, 4096):
+            wake.set()
+
+    threading.Thread(target=loop, daemon=True).start()
+    return True
+
+
+def load_store(store: pathlib.Path) -> pd.DataFrame:
+    """Read the navs ingested by the watch mode (`.parquet` or SQLite `.db`)"""
+    cols = ["文件"] + NAV_COLS
+    if not store.exists():
+        return pd.DataFrame(columns=cols)
+    if store.suffix == ".parquet":
+        return pd.read_parquet(store)
+    with closing(sqlite3.connect(store)) as con:
+        out = pd.read_sql("select * from nav", con)
+    out.columns = cols
+    out["净值日期"] = pd.to_datetime(out["净值日期"]).dt.date
+    return out
+
+
+def update_store(new: pd.DataFrame, store: pathlib.Path) -> pd.DataFrame:
+    """Merge `new` navs into the store atomically and return all the navs
+
+    The rows are keyed by the source file, so a modified file replaces its old nav.
+    Parquet is written to a temp file and renamed, SQLite updates in a transaction.
+    """
+    if store.suffix == ".parquet":
+        out = new
+        if store.exists():
+            out = pd.concat([load_store(store), new], ignore_index=True)
+        out = out.drop_duplicates("文件", keep="last").sort_values("净值日期")
+        tmp = store.with_name(store.name + ".tmp")
+        out.to_parquet(tmp, index=False)
+        os.replace(tmp, store)
+        return out
+    if store.suffix not in [".db", ".sqlite"]:
+        raise NameError(f"The store must end with .parquet, .db or .sqlite ({store})")
+    with closing(sqlite3.connect(store)) as con, con:
+        con.execute(
+            "create table if not exists nav "
+            "(file text primary key, ref_date text, nav real, nav_acc real)"
+        )
+        rows = [
+            (x[0], x[1].isoformat(), x[2], x[3]) for x in new.itertuples(index=False)
+        ]
+        con.executemany("insert or replace into nav values (?, ?, ?, ?)", rows)
+    return load_store(store).sort_values("净值日期")
+
+
+def expand_excels(f: pathlib.Path) -> list[Excel]:
+    if f.suffix == ".zip":
+        return sorted(find_zip_excels(f), key=str)
+    return [f]
+
+
+@dataclass
+class Watcher:
+    """Ingest the valuation tables that arrive in `fromdir` continuously
+
+    Each `poll()` scans the folder once. A file is parsed only after its size and
+    mtime stay unchanged for `settle` seconds, so files still being written are
+    not read. The navs are merged into `store` and optionally written to the
+    `snapshot` xlsx.
+    """
+
+    fromdir: pathlib.Path
+    store: pathlib.Path
+    date_rgs: tuple[int, int]
+    nav_nms: tuple[str, str]
+    sheet: str | int = 0
+    snapshot: Optional[pathlib.Path] = None
+    settle: float = 2.0
+    layouts: Layouts = field(default_factory=dict)
+    seen: dict[pathlib.Path, tuple[int, int]] = field(default_factory=dict)
+    # the files that failed to ingest, tried again only once they change
+    failed: dict[pathlib.Path, tuple[int, int]] = field(default_factory=dict)
+    pending: dict[pathlib.Path, tuple[tuple[int, int], float]] = field(
+        default_factory=dict
+    )
+
+    def __post_init__(self) -> None:
+        sources = set(load_store(self.store)["文件"])
+        for f, sig in self.scan().items():
+            try:
+                excels = expand_excels(f)
+            except Exception:
+                # it's logged when the ingest fails later
+                continue
+            if all(str(x) in sources for x in excels):
+                self.seen[f] = sig
+
+    def scan(self) -> dict[pathlib.Path, tuple[int, int]]:
+        out = {}
+        with os.scandir(self.fromdir) as it:
+            for entry in it:
+                f = pathlib.Path(entry.path)
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                if f.suffix not in EXCEL_SUFFIXES + [".zip"]:
+                    continue
+                st = entry.stat()
+                out[f] = (st.st_size, st.st_mtime_ns)
+        return out
+
+    def poll(self) -> Optional[pd.DataFrame]:
+        """Scan once and ingest the settled files, returns all navs if updated"""
+        now = time.monotonic()
+        ready = {}
+        for f, sig in self.scan().items():
+            if self.seen.get(f) == sig or self.failed.get(f) == sig:
+                continue
+            prev = self.pending.get(f)
+            if prev is None or prev[0] != sig:
+                self.pending[f] = (sig, now)
+            elif now - prev[1] >= self.settle:
+                del self.pending[f]
+                ready[f] = sig
+        if len(ready) == 0:
+            return None
+        return self.ingest(ready)
+
+    def read_file(self, f: pathlib.Path) -> list[tuple]:
+        out = []
+        for excel, content in iter_contents(expand_excels(f)):
+            try:
+                nav = read_nav(
+                    content, self.date_rgs, self.nav_nms, self.sheet, self.layouts
+                )
+            except (LookupError, ValueError) as e:
+                logging.warning(f"Fail to parse {excel}: {e}")
+                continue
+            logging.info(f"{excel.name} is parsed: {nav}")
+            out.append((str(excel), *astuple(nav)))
+        return out
+
+    def ingest(
+        self, files: dict[pathlib.Path, tuple[int, int]]
+    ) -> Optional[pd.DataFrame]:
+        """Merge the navs of the files into the store, returns all navs if updated
+
+        A file is marked as seen only after it's stored. The ones that fail (e.g.,
+        a broken zip archive) are logged instead of stopping `run()`, and tried
+        again only when their size or mtime changes.
+        """
+        out, done = [], []
+        for f in sorted(files):
+            try:
+                out += self.read_file(f)
+            except Exception:
+                logging.exception(f"Fail to ingest {f}")
+                self.failed[f] = files[f]
+                continue
+            self.failed.pop(f, None)
+            done.append(f)
+        if len(out) == 0:
+            for f in done:
+                self.seen[f] = files[f]
+            return None
+        new = pd.DataFrame(out, columns=["文件"] + NAV_COLS)
+        navs = update_store(new, self.store)
+        if self.snapshot is not None:
+            tmp = self.snapshot.with_name(".tmp_" + self.snapshot.name)
+            navs[NAV_COLS].to_excel(tmp)
+            os.replace(tmp, self.snapshot)
+        for f in done:
+            self.seen[f] = files[f]
+        return navs
+
+    def run(self, interval: float = 1.0) -> None:
+        wake = threading.Event()
+        inotify = start_inotify(self.fromdir, wake)
+        if not inotify:
+            logging.info("inotify is not available, fall back to polling")
+        logging.info(f"Watching {self.fromdir}...")
+        while True:
+            self.poll()
+            # while files are settling, it must rescan after the interval, or
+            # it sleeps until inotify reports a change
+            wake.wait(interval if self.pending or not inotify else None)
+            wake.clear()
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "fromdir", type=str, help="the directory that stores the nav excels (估值表)"
+        "fromdir",
+        type=str,
+        help="the directory or zip archive that stores the nav excels (估值表), "
+        "the zip archives in the directory are read as well",
     )
     parser.add_argument(
-        "toexcel", type=str, help="the excel file that stores the parsed result"
+        "toexcel",
+        type=str,
+        nargs="?",
+        help="the excel file that stores the parsed result "
+        "(optional snapshot in the watch mode)",
     )
     parser.add_argument(
         "-date_rgs",
@@ -174,6 +583,33 @@ def main() -> None:
         help="only parse the first n Excels (default 0, means all)",
         default=0,
     )
+    parser.add_argument(
+        "--layouts",
+        type=str,
+        help="the json file that remembers the learned layouts of the nav tables, "
+        "it will be created if not exists",
+        default=None,
+    )
+    parser.add_argument(
+        "--watch",
+        help="keep watching `fromdir` and ingest the newly arrived excels into "
+        "`--store`, `toexcel` is rewritten as a snapshot if provided",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        help="the .parquet or SQLite (.db) file that stores the navs in the watch mode",
+        default=None,
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        help="the seconds that a file must stay unchanged before being parsed "
+        "in the watch mode (default 2)",
+        default=2.0,
+    )
     parser.add_argument(
         "--overwrite",
         help="overwrite the `toexcel` if exists",
@@ -202,8 +638,12 @@ def main() -> None:
     )
 
     opt = parser.parse_args()
-    toexcel = pathlib.Path(opt.toexcel).expanduser()
-    if toexcel.exists() and opt.overwrite is False:
+    if opt.toexcel is None and not opt.watch:
+        parser.error("the following arguments are required: toexcel")
+    if opt.watch and opt.store is None:
+        parser.error("`--store` is required in the watch mode")
+    toexcel = None if opt.toexcel is None else pathlib.Path(opt.toexcel).expanduser()
+    if toexcel is not None and toexcel.exists() and opt.overwrite is False:
         raise FileExistsError(f"{toexcel} already exists")
 
     if opt.debug:
@@ -211,14 +651,44 @@ def main() -> None:
     elif opt.verbose:
         logging.basicConfig(level=logging.INFO)
 
+    layouts_path = None
+    layouts = None
+    if opt.layouts is not None:
+        layouts_path = pathlib.Path(opt.layouts).expanduser()
+        layouts = load_layouts(layouts_path)
+
+    if opt.watch:
+        watcher = Watcher(
+            pathlib.Path(opt.fromdir).expanduser(),
+            pathlib.Path(opt.store).expanduser(),
+            date_rgs=eval(opt.date_rgs),
+            nav_nms=eval(opt.nav_nms),
+            sheet=opt.sheet,
+            snapshot=toexcel,
+            settle=opt.settle,
+            layouts={} if layouts is None else layouts,
+        )
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            if layouts_path is not None:
+                save_layouts(watcher.layouts, layouts_path)
+        return None
+
     excels = find_all_excels(opt.fromdir)
     if opt.n > 0:
         excels = excels[: opt.n]
     logging.debug(f"find excels: {list(map(lambda x: x.name, excels))}")
 
     out = read_navs(
-        excels, date_rgs=eval(opt.date_rgs), nav_nms=eval(opt.nav_nms), sheet=opt.sheet
+        excels,
+        date_rgs=eval(opt.date_rgs),
+        nav_nms=eval(opt.nav_nms),
+        sheet=opt.sheet,
+        layouts=layouts,
     )
+    if layouts_path is not None and layouts is not None:
+        save_layouts(layouts, layouts_path)
     out.to_excel(opt.toexcel)
 
     if opt.o:
@@ -1,29 +1,34 @@
 """读取中保登组合类产品月度报告数据
 读取Excel里的组合产品数据并生成为Excel
+
+使用`--batch`时，读取文件夹中尚未导入的各月报告，写入按报告月份分区的Parquet数据集
 """
 
 import pathlib
-from PyPDF2 import PdfFileReader
+from PyPDF2 import PdfReader
 import pandas as pd
 import logging
 import re
+from datetime import datetime
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
+import hashlib
+import inspect
+import pickle
+import sqlite3
+import os
+import shutil
 import writexlsx
 
 
-def rate2num(x: pd.Series) -> list | pd.Series:
-    if not pd.api.types.is_string_dtype(x):
-        return x
-    out: list = []
-    for elem in x:
-        if pd.isna(elem) or elem == "-":
-            out.append(pd.NA)
-        elif elem.find("%") > -1:
-            out.append(pd.to_numeric(elem.replace("%", "")) / 100.0)
-        else:
-            out.append(pd.to_numeric(elem))
-    return out
+def parse_num(x: Optional[str]) -> float:
+    """convert the number or percentage string to float, `-` or None means NA"""
+    if x is None or x == "-":
+        return float("nan")
+    if x.endswith("%"):
+        return float(x[:-1]) / 100.0
+    return float(x)
 
 
 def find_prod_type(x: list[str]) -> str:
@@ -35,35 +40,6 @@ def find_prod_type(x: list[str]) -> str:
     return "N/A"
 
 
-def conv_normal(x: list[str]) -> pd.DataFrame:
-    txt = filter(lambda x: x.count(" ") == 6 and x.find("产品全称") == -1, x)
-    cols = [
-        "产品全称",
-        "产品成立时间",
-        "期末累计单位净值(元/份)",
-        "当月累计单位净值增长率",
-        "年初以来累计单位净值增长率",
-        "期末净资产(亿元)",
-        "产品管理机构",
-    ]
-    return pd.DataFrame(map(lambda x: x.split(" "), txt), columns=cols)
-
-
-def conv_mmp(x: list[str]) -> pd.DataFrame:
-    txt = filter(lambda x: x.count(" ") == 4 and x.find("产品全称") == -1, x)
-    cols = [
-        "产品全称",
-        "产品成立时间",
-        "年初以来累计单位净值增长率",
-        "期末净资产(亿元)",
-        "产品管理机构",
-    ]
-    out = pd.DataFrame(map(lambda x: x.split(" "), txt), columns=cols)
-    out["期末累计单位净值(元/份)"] = pd.NA
-    out["当月累计单位净值增长率"] = pd.NA
-    return out
-
-
 def rm_space(x: str) -> str:
     """remove unexpected space from table strings
 
@@ -96,38 +72,363 @@ def rm_garbage(x: str) -> list[str]:
     return x.strip().split("\n")
 
 
-def read_tbl(pdf_path: pathlib.Path, pages: Optional[list[int]] = None) -> pd.DataFrame:
-    out: list[pd.DataFrame] = []
-    p: PdfFileReader = PdfFileReader(pdf_path)
-    for i in range(p.getNumPages()):
-        if pages is not None:
-            if i + 1 not in pages:
-                continue
-        logging.info(f"handling page {i + 1}/{p.getNumPages()}")
-        txt = list(map(rm_space, rm_garbage(p.getPage(i).extract_text())))
-        normal_df = conv_normal(txt)
-        mmp_df = conv_mmp(txt)
-        df = pd.concat([normal_df, mmp_df])
-        df["产品类型"] = find_prod_type(txt)
-        out.append(df)
-        logging.debug(f"page {i} has {len(df)} rows with {find_prod_type(txt)} type")
-    if len(out) == 0:
+COLS = [
+    "产品全称",
+    "产品成立时间",
+    "期末累计单位净值(元/份)",
+    "当月累计单位净值增长率",
+    "年初以来累计单位净值增长率",
+    "期末净资产(亿元)",
+    "产品管理机构",
+    "产品类型",
+]
+# the normal table has 7 fields while the money market one (mmp) has 5 fields,
+# without the unit nav and the monthly growth rate
+ROW_PATTERN = re.compile(r"(\S+) (\d{8}) (?:(\S+) (\S+) )?(\S+) (\S+) (\S+)")
+
+
+def parse_page(raw: str, cols: dict[str, list]) -> int:
+    """parse the table rows of a page into the typed column buffers in one pass
+
+    Args:
+        raw (str): the text extracted from the pdf page
+        cols (dict[str, list]): the column buffers keyed by `COLS`, the parsed
+        values are appended in place
+
+    Returns:
+        int: the number of rows found in the page
+    """
+    others = []
+    n = 0
+    for line in rm_garbage(raw):
+        line = rm_space(line)
+        match = ROW_PATTERN.fullmatch(line)
+        if match is None:
+            others.append(line)
+            continue
+        name, date, nav, mon, ytd, asset, mgr = match.groups()
+        cols["产品全称"].append(name)
+        cols["产品成立时间"].append(
+            datetime(int(date[:4]), int(date[4:6]), int(date[6:]))
+        )
+        cols["期末累计单位净值(元/份)"].append(parse_num(nav))
+        cols["当月累计单位净值增长率"].append(parse_num(mon))
+        cols["年初以来累计单位净值增长率"].append(parse_num(ytd))
+        cols["期末净资产(亿元)"].append(parse_num(asset))
+        cols["产品管理机构"].append(mgr)
+        n += 1
+    cols["产品类型"].extend([find_prod_type(others)] * n)
+    return n
+
+
+def split_chunks(x: list[int], n: int) -> list[list[int]]:
+    """split x into at most n contiguous chunks of similar sizes"""
+    n = max(min(n, len(x)), 1)
+    size, rem = divmod(len(x), n)
+    out = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < rem else 0)
+        out.append(x[start:end])
+        start = end
+    return out
+
+
+def select_pages(n: int, pages: Optional[list[int]]) -> list[int]:
+    """the sorted valid pages among the n pages, None means all pages"""
+    if pages is None:
+        return list(range(1, n + 1))
+    return sorted(set(filter(lambda x: 1 <= x <= n, pages)))
+
+
+def extract_pages(pdf_path: pathlib.Path, pages: list[int]) -> list[str]:
+    """extract the text of the pages (starting from 1), the pdf is opened only once"""
+    p = PdfReader(pdf_path)
+    out = []
+    for page in pages:
+        logging.info(f"handling page {page}/{len(p.pages)}")
+        out.append(p.pages[page - 1].extract_text())
+    return out
+
+
+def extract_texts(
+    pdf_path: pathlib.Path, pages: Optional[list[int]] = None, jobs: int = 1
+) -> list[tuple[int, str]]:
+    """extract the text of the pages in page order
+
+    Args:
+        pdf_path (pathlib.Path): the pdf file
+        pages (Optional[list[int]], optional): the pages to be extracted, starting
+        from 1. Only these pages are visited. Defaults to None, means all pages.
+        jobs (int, optional): the number of worker processes. Each worker opens the
+        pdf once and handles a contiguous page range. Defaults to 1.
+
+    Returns:
+        list[tuple[int, str]]: the page number and the text
+    """
+    todo = select_pages(len(PdfReader(pdf_path).pages), pages)
+    if jobs <= 1 or len(todo) <= 1:
+        return list(zip(todo, extract_pages(pdf_path, todo)))
+    chunks = split_chunks(todo, jobs)
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        texts = executor.map(extract_pages, [pdf_path] * len(chunks), chunks)
+        return list(zip(todo, (txt for chunk in texts for txt in chunk)))
+
+
+def file_digest(x: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(x, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def rules_digest() -> str:
+    """the fingerprint of the parsing rules, it changes when any rule is modified"""
+    funs = [rm_space, rm_garbage, find_prod_type, parse_num, parse_page]
+    src = [inspect.getsource(f) for f in funs] + [ROW_PATTERN.pattern] + COLS
+    return hashlib.sha256("\n".join(src).encode()).hexdigest()
+
+
+class PageCache:
+    """The on-disk (SQLite) cache of the extracted text and parsed rows of pdf pages
+
+    The pages are keyed by the pdf content hash and the page number, so the
+    cache is invalidated automatically when the file changes. The parsed rows
+    are keyed by `rules_digest()` as well, so after tuning the rules they are
+    re-parsed from the cached text without decoding the pdf again.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.con = sqlite3.connect(path)
+        with self.con:
+            self.con.execute(
+                "create table if not exists npages (pdf text primary key, n integer)"
+            )
+            self.con.execute(
+                "create table if not exists texts "
+                "(pdf text, page integer, text text, primary key (pdf, page))"
+            )
+            self.con.execute(
+                "create table if not exists rows "
+                "(pdf text, rules text, page integer, data blob, "
+                "primary key (pdf, rules, page))"
+            )
+
+    def close(self) -> None:
+        self.con.close()
+
+    def get_npages(self, pdf: str) -> Optional[int]:
+        sql = "select n from npages where pdf = ?"
+        row = self.con.execute(sql, (pdf,)).fetchone()
+        return None if row is None else row[0]
+
+    def put_npages(self, pdf: str, n: int) -> None:
+        with self.con:
+            self.con.execute("insert or replace into npages values (?, ?)", (pdf, n))
+
+    def get_texts(self, pdf: str, pages: list[int]) -> dict[int, str]:
+        sql = "select page, text from texts where pdf = ?"
+        wanted = set(pages)
+        rows = self.con.execute(sql, (pdf,))
+        return {page: text for page, text in rows if page in wanted}
+
+    def put_texts(self, pdf: str, texts: dict[int, str]) -> None:
+        rows = [(pdf, page, text) for page, text in texts.items()]
+        with self.con:
+            self.con.executemany("insert or replace into texts values (?, ?, ?)", rows)
+
+    def get_rows(
+        self, pdf: str, rules: str, pages: list[int]
+    ) -> dict[int, dict[str, list]]:
+        sql = "select page, data from rows where pdf = ? and rules = ?"
+        wanted = set(pages)
+        rows = self.con.execute(sql, (pdf, rules))
+        return {page: pickle.loads(data) for page, data in rows if page in wanted}
+
+    def put_rows(self, pdf: str, rules: str, rows: dict[int, dict[str, list]]) -> None:
+        sql = "insert or replace into rows values (?, ?, ?, ?)"
+        data = [(pdf, rules, page, pickle.dumps(x)) for page, x in rows.items()]
+        with self.con:
+            self.con.executemany(sql, data)
+
+
+def page_rows(raw: str) -> dict[str, list]:
+    cols: dict[str, list] = {col: [] for col in COLS}
+    parse_page(raw, cols)
+    return cols
+
+
+def read_rows(
+    pdf_path: pathlib.Path,
+    pages: Optional[list[int]] = None,
+    jobs: int = 1,
+    cache: Optional[PageCache] = None,
+) -> list[tuple[int, dict[str, list]]]:
+    """read the parsed rows of each page in page order, see `read_tbl()`"""
+    if cache is None:
+        texts = extract_texts(pdf_path, pages, jobs)
+        return [(i, page_rows(raw)) for i, raw in texts]
+    pdf = file_digest(pdf_path)
+    n = cache.get_npages(pdf)
+    if n is None:
+        n = len(PdfReader(pdf_path).pages)
+        cache.put_npages(pdf, n)
+    todo = select_pages(n, pages)
+    rules = rules_digest()
+    rows = cache.get_rows(pdf, rules, todo)
+    missing = [i for i in todo if i not in rows]
+    texts = cache.get_texts(pdf, missing)
+    logging.info(
+        f"{len(rows)} pages' rows and {len(texts)} pages' text are read from cache"
+    )
+    to_extract = [i for i in missing if i not in texts]
+    if len(to_extract) > 0:
+        extracted = dict(extract_texts(pdf_path, to_extract, jobs))
+        cache.put_texts(pdf, extracted)
+        texts.update(extracted)
+    parsed = {i: page_rows(texts[i]) for i in missing}
+    cache.put_rows(pdf, rules, parsed)
+    rows.update(parsed)
+    return [(i, rows[i]) for i in todo]
+
+
+def read_tbl(
+    pdf_path: pathlib.Path,
+    pages: Optional[list[int]] = None,
+    jobs: int = 1,
+    cache: Optional[PageCache] = None,
+) -> pd.DataFrame:
+    """read the product table from the pdf report
+
+    Args:
+        pdf_path (pathlib.Path): the pdf report
+        pages (Optional[list[int]], optional): the pages to be parsed, starting from
+        1. Defaults to None, means all pages.
+        jobs (int, optional): the number of processes that extract the pages in
+        parallel. Defaults to 1.
+        cache (Optional[PageCache], optional): when provided, the extracted text and
+        the parsed rows are read from or saved to the cache. Defaults to None.
+
+    Raises:
+        RuntimeError: when no page is parsed
+
+    Returns:
+        pd.DataFrame: the table of `COLS`
+    """
+    pages_rows = read_rows(pdf_path, pages, jobs, cache)
+    if len(pages_rows) == 0:
         raise RuntimeError("no table content found")
-    out2: pd.DataFrame = pd.concat(out, ignore_index=True)
-    out2["产品成立时间"] = pd.to_datetime(out2["产品成立时间"], format="%Y%m%d")
-    out2["期末累计单位净值(元/份)"] = pd.to_numeric(out2["期末累计单位净值(元/份)"])
-    out2["期末净资产(亿元)"] = pd.to_numeric(out2["期末净资产(亿元)"])
-    out2["当月累计单位净值增长率"] = rate2num(out2["当月累计单位净值增长率"])
-    out2["年初以来累计单位净值增长率"] = rate2num(out2["年初以来累计单位净值增长率"])
-    return out2
+    cols: dict[str, list] = {col: [] for col in COLS}
+    for i, x in pages_rows:
+        for col in COLS:
+            cols[col].extend(x[col])
+        logging.debug(f"page {i} has {len(x[COLS[0]])} rows")
+    return pd.DataFrame(cols)
+
+
+PARTITION = "报告月份"
+
+
+def report_month(pdf_path: pathlib.Path, cache: Optional[PageCache] = None) -> str:
+    """find the report month (`%Y-%m`) from the file name or the first page
+
+    The first page is decoded only when the file name has no month and its text is
+    not in the cache, and the text is cached for the later parsing of the table.
+    """
+    patterns = [
+        r"(\d{4})\s*年\s*(\d{1,2})\s*月",
+        r"(20\d{2})[-_.]?(0[1-9]|1[0-2])(?!\d)",
+    ]
+    for pattern in patterns:
+        if (match := re.search(pattern, pdf_path.stem)) is not None:
+            return f"{match.group(1)}-{int(match.group(2)):02d}"
+    if cache is None:
+        txt = extract_pages(pdf_path, [1])[0]
+    else:
+        pdf = file_digest(pdf_path)
+        txt = cache.get_texts(pdf, [1]).get(1)
+        if txt is None:
+            txt = extract_pages(pdf_path, [1])[0]
+            cache.put_texts(pdf, {1: txt})
+    if (match := re.search(patterns[0], txt)) is not None:
+        return f"{match.group(1)}-{int(match.group(2)):02d}"
+    raise LookupError(f"Fail to find the report month of {pdf_path}")
+
+
+def ingested_months(dataset: pathlib.Path) -> set[str]:
+    if not dataset.exists():
+        return set()
+    prefix = PARTITION + "="
+    return {
+        x.name.removeprefix(prefix)
+        for x in dataset.iterdir()
+        if x.is_dir() and x.name.startswith(prefix)
+    }
+
+
+def write_partition(df: pd.DataFrame, dataset: pathlib.Path, month: str) -> None:
+    """write the month into the hive-partitioned parquet dataset
+
+    The partition is written into a temp folder and renamed, so a failed run never
+    leaves a half-written month that would be regarded as ingested.
+    """
+    tmp = dataset / f".tmp_{month}"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    df.to_parquet(tmp / "part-0.parquet", index=False)
+    os.replace(tmp, dataset / f"{PARTITION}={month}")
+
+
+def ingest_reports(
+    folder: pathlib.Path,
+    dataset: pathlib.Path,
+    jobs: int = 1,
+    cache: Optional[PageCache] = None,
+) -> list[str]:
+    """parse the monthly reports in folder that have not been ingested into dataset
+
+    The dataset is partitioned by the report month (`报告月份`), so the queries
+    of some months only scan the needed partitions, e.g.,
+    `pd.read_parquet(dataset, filters=[("报告月份", ">=", "2023-01")])`.
+
+    Returns:
+        list[str]: the newly ingested months
+    """
+    done = ingested_months(dataset)
+    todo: dict[str, pathlib.Path] = {}
+    for pdf in sorted(folder.glob("*.pdf")):
+        month = report_month(pdf, cache)
+        if month in done:
+            continue
+        if month in todo:
+            raise ValueError(f"{todo[month].name} and {pdf.name} are both {month}")
+        todo[month] = pdf
+    for i, (month, pdf) in enumerate(sorted(todo.items())):
+        logging.info(f"ingesting {i + 1} of {len(todo)}, {month} ({pdf.name})...")
+        write_partition(read_tbl(pdf, jobs=jobs, cache=cache), dataset, month)
+    return sorted(todo)
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "pdf", type=str, help="中保登月度组合行情-开放式组合类资管产品清单的文档路径"
+        "pdf",
+        type=str,
+        help="中保登月度组合行情-开放式组合类资管产品清单的文档路径"
+        "（批量模式下为存放各月报告的文件夹）",
+    )
+    parser.add_argument(
+        "excel", type=str, help="生成的Excel路径（批量模式下为Parquet数据集的文件夹）"
+    )
+    parser.add_argument(
+        "--batch",
+        help="ingest the reports of the months not ingested yet into the parquet "
+        "dataset partitioned by the report month",
+        action="store_true",
+        default=False,
     )
-    parser.add_argument("excel", type=str, help="生成的Excel路径")
     parser.add_argument(
         "-p",
         "--pages",
@@ -135,6 +436,20 @@ def main() -> None:
         help="the page range to be parsed, starting from 1",
         default=None,
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="the number of processes that extract the pages in parallel (default 1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="the SQLite file that caches the extracted text and parsed rows of "
+        "the pages, it will be created if not exists",
+        default=None,
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -189,9 +504,20 @@ def main() -> None:
     out_path = pathlib.Path(opt.excel).expanduser()
     if not pdf_path.exists():
         raise FileNotFoundError(f"{opt.pdf}")
-    if not opt.overwrite and out_path.exists():
+    if not opt.batch and not opt.overwrite and out_path.exists():
         raise FileExistsError(f"{opt.excel}")
-    df = read_tbl(pdf_path, pages)
+    cache = None
+    if opt.cache is not None:
+        cache = PageCache(pathlib.Path(opt.cache).expanduser())
+    try:
+        if opt.batch:
+            months = ingest_reports(pdf_path, out_path, opt.jobs, cache)
+            logging.info(f"{len(months)} months are ingested: {months}")
+            return None
+        df = read_tbl(pdf_path, pages, opt.jobs, cache)
+    finally:
+        if cache is not None:
+            cache.close()
     writexlsx.write(df, out_path, overwrite=opt.overwrite, open=opt.open)
 
 
@@ -1,59 +1,388 @@
 """Rotate the video files in a folder
 This requires `ffmpeg` available in the system path.
+
+By default, the MP4/MOV files are rotated losslessly: the streams are copied and
+only the display rotation in the container is set, which is orders of magnitude
+faster than re-encoding. The others (or `--reencode`) are re-encoded by libx264.
+
+Several files can be rotated at once with `--jobs`, each ffmpeg process is given
+a share of the cores via `-threads`, so that jobs x threads is about the cores.
+
+The batch is resumable: each output is written to a temp name and renamed when
+done, and recorded in a journal in the output folder. Re-running the same batch
+skips the finished files, so a restart costs only the unfinished work. The fps,
+speed and ETA of each file are reported live from ffmpeg's `-progress` pipe.
 """
 import subprocess
+import tempfile
 import pathlib
 import argparse
+import os
+import json
+import threading
+import concurrent.futures
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# the containers that carry the display matrix
+METADATA_SUFFIXES = {".mp4", ".mov", ".m4v", ".3gp"}
+# the counter clock-wise degrees of `-display_rotation` of each transpose
+DISPLAY_ROTATION = {1: -90, 2: 90}
+# the finished files of the batch, in the out_folder
+JOURNAL = ".rotate_journal.jsonl"
+# the lines printed by the worker threads mustn't interleave
+PRINT_LOCK = threading.Lock()
+
+
+def say(x: object) -> None:
+    with PRINT_LOCK:
+        print(x, flush=True)
+
+
+class Journal:
+    """the files done in the out_folder, with the size and mtime of the source
+
+    A file is done only if its output exists and the source is unchanged.
+    """
+
+    def __init__(self, folder: pathlib.Path) -> None:
+        self.path = folder / JOURNAL
+        self.lock = threading.Lock()
+        self.entries: dict[str, dict] = {}
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                try:
+                    x = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # the last line may be cut by a crash
+                self.entries[x["file"]] = x
+        self.path.touch()
+
+    @staticmethod
+    def entry(file: pathlib.Path, out_file: pathlib.Path) -> dict:
+        stat = file.stat()
+        return {
+            "file": file.name,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "out_size": out_file.stat().st_size,
+        }
+
+    def done(self, file: pathlib.Path, out_file: pathlib.Path) -> bool:
+        if file.name not in self.entries or not out_file.exists():
+            return False
+        return self.entries[file.name] == self.entry(file, out_file)
+
+    def add(self, file: pathlib.Path, out_file: pathlib.Path) -> None:
+        x = self.entry(file, out_file)
+        with self.lock:
+            self.entries[file.name] = x
+            with self.path.open("a") as f:
+                f.write(json.dumps(x) + "\n")
+
+
+@dataclass
+class Progress:
+    """the progress of a file, parsed from the key=value lines of `-progress`"""
+
+    file: str
+    duration: Optional[float] = None  # seconds
+    frame: int = 0
+    fps: float = 0.0
+    out_time: float = 0.0  # seconds
+    speed: Optional[float] = None
+
+    def feed(self, line: str) -> bool:
+        """parse a line, return True at the end of each block"""
+        key, _, value = line.strip().partition("=")
+        try:
+            if key == "frame":
+                self.frame = int(value)
+            elif key == "fps":
+                self.fps = float(value)
+            elif key == "out_time_us":
+                self.out_time = int(value) / 1e6
+            elif key == "speed":
+                self.speed = float(value.rstrip("x"))
+        except ValueError:
+            pass  # e.g. "N/A" at the beginning
+        return key == "progress"
+
+    def eta(self) -> Optional[float]:
+        """the remaining seconds"""
+        if self.duration is None or not self.speed:
+            return None
+        return max(self.duration - self.out_time, 0) / self.speed
+
+    def __str__(self) -> str:
+        out = f"{self.file}:"
+        if self.duration:
+            out += f" {min(self.out_time / self.duration, 1):.0%}"
+        out += f" fps={self.fps:.1f}"
+        if self.speed is not None:
+            out += f" speed={self.speed:.2f}x"
+        if (eta := self.eta()) is not None:
+            out += f" ETA {eta:.0f}s"
+        return out
+
+
+def probe_duration(file: pathlib.Path) -> Optional[float]:
+    """the duration in seconds by `ffprobe`, None if unknown"""
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "default=noprint_wrappers=1:nokey=1",
+        str(file),
+    ]
+    try:
+        res = subprocess.run(cmd, capture_output=True, text=True)
+        return float(res.stdout.strip())
+    except (OSError, ValueError):
+        return None
+
+
+def probe_rotation(file: pathlib.Path) -> int:
+    """the display rotation (counter clock-wise degrees) of the video stream by
+    `ffprobe`, 0 if there's none"""
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream_side_data=rotation",
+        "-of",
+        "default=noprint_wrappers=1:nokey=1",
+        str(file),
+    ]
+    try:
+        res = subprocess.run(cmd, capture_output=True, text=True)
+        return int(float(res.stdout.split()[0]))
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def part_file(out_file: pathlib.Path) -> pathlib.Path:
+    """the temp name of the output before it's done (the suffix is kept for ffmpeg
+    to know the format)"""
+    return out_file.with_name(f".{out_file.stem}.part{out_file.suffix}")
+
+
+def thread_budget(jobs: int) -> Optional[int]:
+    """the `-threads` of each ffmpeg process so that jobs x threads ~ cores
+
+    None when there's a single job, i.e., ffmpeg decides by itself.
+    """
+    if jobs <= 1:
+        return None
+    return max((os.cpu_count() or 1) // jobs, 1)
+
+
+def ffmpeg_cmd(
+    file: pathlib.Path,
+    out_file: pathlib.Path,
+    speed: str,
+    transpose: int,
+    threads: Optional[int] = None,
+) -> list[str]:
+    cmd: list[str] = [
+        "ffmpeg",
+        "-i",
+        str(file),
+        "-loglevel",
+        "fatal",
+        "-nostats",  # to be less verbose
+        "-c:v",
+        "libx264",
+        "-preset",
+        f"{speed}",
+        "-vf",
+        f"transpose={transpose}",
+    ]
+    if threads is not None:
+        cmd += ["-threads", str(threads)]
+    return cmd + [str(out_file)]
+
+
+def can_copy(file: pathlib.Path, transpose: int) -> bool:
+    """whether the rotation can be set by the display matrix metadata only"""
+    return file.suffix.lower() in METADATA_SUFFIXES and transpose in DISPLAY_ROTATION
+
+
+def copy_cmd(
+    file: pathlib.Path, out_file: pathlib.Path, transpose: int, rotation: int = 0
+) -> list[str]:
+    """copy the streams and set the display rotation (requires ffmpeg 6.0+)
+
+    `-display_rotation` replaces the rotation of the input, so the transpose is
+    added to its existing `rotation`, the same as re-encoding the rotated frames.
+    """
+    degrees = (rotation + DISPLAY_ROTATION[transpose] + 180) % 360 - 180
+    return [
+        "ffmpeg",
+        "-display_rotation",
+        str(degrees),
+        "-i",
+        str(file),
+        "-loglevel",
+        "fatal",
+        "-nostats",
+        "-c",
+        "copy",
+        str(out_file),
+    ]
+
+
+def run_ffmpeg(
+    cmd: list[str],
+    out_file: pathlib.Path,
+    progress: Optional[Progress] = None,
+    report: Optional[Callable[[Progress], None]] = None,
+) -> Optional[str]:
+    """run the ffmpeg command, return the error message if it fails
+
+    With `progress`, `-progress pipe:1` is added and `report` is called at each
+    progress block. The partially written output is removed on failure.
+
+    `-nostdin` keeps the concurrent processes from reading the terminal. The
+    stderr goes to a temp file, so a chatty ffmpeg never blocks on a full pipe
+    while the progress is read from the stdout.
+    """
+    opts = ["-nostdin"]
+    if progress is not None:
+        opts += ["-progress", "pipe:1"]
+    cmd = cmd[:1] + opts + cmd[1:]
+    with tempfile.TemporaryFile("w+") as stderr:
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                text=True,
+            )
+        except OSError as e:
+            return str(e)
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            if progress is not None and progress.feed(line) and report is not None:
+                report(progress)
+        if proc.wait() == 0:
+            return None
+        stderr.seek(0)
+        err = stderr.read().strip()
+    out_file.unlink(missing_ok=True)
+    return err or f"ffmpeg exited with {proc.returncode}"
+
+
+def rotate_file(
+    file: pathlib.Path,
+    out_file: pathlib.Path,
+    speed: str,
+    transpose: int,
+    threads: Optional[int] = None,
+    reencode: bool = False,
+    report: Optional[Callable[[Progress], None]] = None,
+) -> tuple[str, Optional[str]]:
+    """rotate a file, return the method ("copy" or "encode") and the error message
+
+    It's written to the `part_file()` first and renamed to `out_file` when done.
+    It falls back to re-encoding when the lossless copy fails, e.g., an older
+    ffmpeg without `-display_rotation`.
+    """
+    tmp = part_file(out_file)
+    tmp.unlink(missing_ok=True)  # left by a crashed run
+    progress = Progress(file.name, probe_duration(file))
+    method, err = "copy", None
+    if not reencode and can_copy(file, transpose):
+        cmd = copy_cmd(file, tmp, transpose, probe_rotation(file))
+        err = run_ffmpeg(cmd, tmp, progress, report)
+        if err is not None:
+            say(f"{file.name}: the lossless copy failed ({err}), re-encoding")
+    if reencode or not can_copy(file, transpose) or err is not None:
+        method = "encode"
+        cmd = ffmpeg_cmd(file, tmp, speed, transpose, threads)
+        err = run_ffmpeg(cmd, tmp, progress, report)
+    if err is None:
+        os.replace(tmp, out_file)
+    return method, err
 
 
 def rotate(
-    files: list[pathlib.Path], out_folder: pathlib.Path, speed: str, transpose: int
+    files: list[pathlib.Path],
+    out_folder: pathlib.Path,
+    speed: str,
+    transpose: int,
+    jobs: int = 1,
+    threads: Optional[int] = None,
+    reencode: bool = False,
 ) -> None:
     """rotate the video files and generate them into out_folder
 
     Args:
         files (list[pathlib.Path]): The video files to be rotated.
-        out_folder (pathlib.Path): Must be an empty folder.
+        out_folder (pathlib.Path): Must be an empty folder, or the out_folder of
+        an earlier batch, whose finished files are skipped.
         It will be created if not exists yet.
         speed (str): Usually be one of ultrafast and fast.
         transpose (int): 1 is 90 clock-wise; 2 is 90 counter clock-wise.
         See more in https://ffmpeg.org/ffmpeg-filters.html#toc-transpose-1
+        jobs (int, optional): The number of ffmpeg processes run at once.
+        Defaults to 1.
+        threads (int, optional): The `-threads` of each ffmpeg process. Defaults
+        to the cores divided by `jobs`.
+        reencode (bool, optional): Always re-encode, even if the container can
+        carry the display rotation. Defaults to False.
 
     Raises:
-        FileExistsError: May throw when `out_folder` is not empty or can't
-        be made.
+        FileExistsError: May throw when `out_folder` is not empty (and not of an
+        earlier batch) or can't be made.
         FileNotFoundError: May throw when `files` doesn't exist.
+        RuntimeError: May throw when any file fails to be rotated, after all the
+        other files are done.
     """
     out_folder = out_folder.expanduser()
     out_folder.mkdir(exist_ok=True)
     if not out_folder.exists():
         raise FileExistsError(f"Fail to create folder {out_folder}")
-    if len(list(out_folder.iterdir())) > 0:
+    if len(list(out_folder.iterdir())) > 0 and not (out_folder / JOURNAL).exists():
         raise FileExistsError(f"out_folder is not empty ({out_folder})")
     for file in files:
         if not file.exists():
             raise FileNotFoundError(f"{file}")
+    journal = Journal(out_folder)
+    todo = [x for x in files if not journal.done(x, out_folder / x.name)]
+    if len(todo) < len(files):
+        print(f"Skipping {len(files) - len(todo)} files done in an earlier run.")
+    files = todo
     n = len(files)
+    if threads is None:
+        threads = thread_budget(jobs)
     print(f"There're {n} files in total.")
-    for i, file in enumerate(files):
-        print(f"Rotating {i+1} of {n}...")
-        out_file = out_folder / file.name
-        cmd: list[str] = [
-            "ffmpeg",
-            "-i",
-            str(file),
-            "-loglevel",
-            "fatal",
-            "-nostats",  # to be less verbose
-            "-c:v",
-            "libx264",
-            "-preset",
-            f"{speed}",
-            "-vf",
-            f"transpose={transpose}",
-            str(out_file),
-        ]
-        subprocess.run(cmd, check=True)
+    failed: dict[pathlib.Path, str] = {}
+    with concurrent.futures.ThreadPoolExecutor(max(jobs, 1)) as executor:
+        futures = {}
+        for file in files:
+            out_file = out_folder / file.name
+            args = (file, out_file, speed, transpose, threads, reencode, say)
+            futures[executor.submit(rotate_file, *args)] = file
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            file = futures[future]
+            method, err = future.result()
+            if err is not None:
+                failed[file] = err
+                say(f"Failed {i + 1} of {n}: {file.name} ({err})")
+            else:
+                journal.add(file, out_folder / file.name)
+                say(f"Rotated {i + 1} of {n}: {file.name} ({method})")
+    if failed:
+        names = ", ".join(f.name for f in failed)
+        raise RuntimeError(f"{len(failed)} of {n} files failed: {names}")
     print(f"All {n} files are done.")
 
 
@@ -87,6 +416,25 @@ def main() -> None:
         default="ultrafast",
         help="Should be one of fast and ultrafast (default)",
     )
+    parser.add_argument(
+        "--reencode",
+        action="store_true",
+        default=False,
+        help="Always re-encode, instead of setting the rotation metadata of the "
+        "MP4/MOV files losslessly",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="The number of files rotated at once (default 1)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        help="The threads of each ffmpeg process (default cores / jobs)",
+    )
     parser.add_argument(
         "ffolder", help="The folder contains the video files to be rotated"
     )
@@ -96,7 +444,15 @@ def main() -> None:
     options = parser.parse_args()
     files = [pathlib.Path(f) for f in get_files(options.ffolder)]
     out_folder = pathlib.Path(options.tfolder)
-    rotate(files, out_folder, options.speed, options.transpose)
+    rotate(
+        files,
+        out_folder,
+        options.speed,
+        options.transpose,
+        options.jobs,
+        options.threads,
+        options.reencode,
+    )
 
 
 if __name__ == "__main__":
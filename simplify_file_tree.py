@@ -1,33 +1,258 @@
 """Simplify The File Tree
 
-Quickly flat the file structure by removing the first level directories
+Quickly flat the file structure by removing the first level directories, or the
+directories up to `--depth` levels (`--all` for any depth)
+
+The moves are planned before any file is touched: the tree is walked once and
+the name collisions are resolved in memory (by prefixing `0_` a few times, then
+numbering like `IMG_0001_1.JPG`), so the plan can be printed by `--dry-run`.
+The executed moves are recorded in a journal, which `--undo` reverts. The files
+on another file system (e.g., a mounted drive inside the target) can't be
+renamed, they're copied and unlinked by a thread pool.
 """
 
 import argparse
+import concurrent.futures
+import contextlib
+import errno
+import json
+import os
 import pathlib
+import shutil
 import subprocess
+from dataclasses import dataclass, field
+from typing import Optional
+
+# the default undo journal in the target folder, used by the command line
+JOURNAL = ".simplify_journal.jsonl"
+PREFIX = "0_"
+# the colliding names are prefixed at most this many times, then numbered, so
+# that hundreds of same-named files don't grow the names without bound
+MAX_PREFIXES = 3
+# the max bytes of a file name on the common file systems
+NAME_MAX = 255
+
+
+@dataclass(frozen=True)
+class Move:
+    src: pathlib.Path
+    dst: pathlib.Path
+    # the src is on another file system, so it must be copied and unlinked
+    cross_device: bool = False
+
+
+@dataclass
+class Plan:
+    """the moves, the deleted files and the removed folders (the deepest first)"""
+
+    target: pathlib.Path
+    moves: list[Move] = field(default_factory=list)
+    deletes: list[pathlib.Path] = field(default_factory=list)
+    rmdirs: list[pathlib.Path] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        out = [
+            f"{x.src} -> {x.dst}" + (" (copy)" if x.cross_device else "")
+            for x in self.moves
+        ]
+        out += [f"delete {x}" for x in self.deletes]
+        out += [f"rmdir {x}" for x in self.rmdirs]
+        return "\n".join(out)
+
+
+class Names:
+    """the names taken in the target, to find a free name without stat calls"""
+
+    def __init__(self, names: set[str]) -> None:
+        self.names = names
+        # the candidate last used for each name, so that the search of the many
+        # same-named files doesn't start over each time
+        self.tries: dict[str, int] = {}
+        # the name and the candidate that each taken name is made from
+        self.origins: dict[str, tuple[str, int]] = {}
+
+    @staticmethod
+    def candidate(name: str, n: int) -> str:
+        """the n-th candidate of the name: `name`, `0_name`, `0_0_name`,
+        `0_0_0_name`, `name_1`, `name_2`, ..., which fits in NAME_MAX"""
+        if n <= MAX_PREFIXES and len((out := PREFIX * n + name).encode()) <= NAME_MAX:
+            return out
+        path = pathlib.PurePath(name)
+        tail = f"_{max(n - MAX_PREFIXES, 1)}{path.suffix}"
+        room = NAME_MAX - len(tail.encode())
+        return path.stem.encode()[:room].decode(errors="ignore") + tail
+
+    def take(self, name: str) -> str:
+        """take the name, or its first free candidate"""
+        n = self.tries.get(name, 0)
+        while (out := self.candidate(name, n)) in self.names:
+            n += 1
+        self.tries[name] = n
+        self.names.add(out)
+        self.origins[out] = (name, n)
+        return out
+
+    def release(self, name: str) -> None:
+        self.names.discard(name)
+        # the search of the name it's made from restarts from the freed one
+        base, k = self.origins.pop(name, (name, 0))
+        if base in self.tries:
+            self.tries[base] = min(self.tries[base], k)
+
 
+def plan(
+    tgt: str | pathlib.Path, rm_empty_folder: bool, depth: Optional[int] = 1
+) -> Plan:
+    """plan the moves that simplify the file tree, nothing is changed
+
+    Args:
+        tgt (str | pathlib.Path): the directory to be simplified
+        rm_empty_folder (bool): whether the empty folder to be removed or not
+        depth (int, optional): the folders up to this level are flattened, e.g.,
+        1 only lifts the contents of the first level folders, and None flattens
+        all. Defaults to 1.
+    """
+    target = pathlib.Path(tgt)
+    out = Plan(target)
+    dev = os.stat(target).st_dev
+    with os.scandir(target) as it:
+        entries = sorted(it, key=lambda x: x.name)
+    names = Names({x.name for x in entries})
+
+    def walk(folder: os.DirEntry, level: int) -> None:
+        # a mount point's files are all on its file system
+        cross_device = folder.stat(follow_symlinks=False).st_dev != dev
+        with os.scandir(folder.path) as it:
+            children = sorted(it, key=lambda x: x.name)
+        for f in children:
+            src = pathlib.Path(f.path)
+            if f.name == ".DS_Store":
+                out.deletes.append(src)
+            elif f.is_dir(follow_symlinks=False) and (depth is None or level < depth):
+                walk(f, level + 1)
+            else:
+                dst = target / names.take(f.name)
+                out.moves.append(Move(src, dst, cross_device))
+        if rm_empty_folder:
+            out.rmdirs.append(pathlib.Path(folder.path))
+
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        walk(entry, 1)
+        if rm_empty_folder:
+            names.release(entry.name)
+    return out
+
+
+def move(x: Move) -> None:
+    """rename, or copy and unlink when it's across the file systems"""
+    if not x.cross_device:
+        try:
+            x.src.rename(x.dst)
+            return
+        except OSError as e:
+            # e.g., a bind mount of the same file system
+            if e.errno != errno.EXDEV:
+                raise
+    shutil.move(x.src, x.dst)
+
+
+def execute(x: Plan, journal: Optional[pathlib.Path] = None, jobs: int = 4) -> None:
+    """run the plan, each move is appended to the journal once done
+
+    The local files are renamed in order while the ones on the other file systems
+    are copied by the thread pool.
+
+    Args:
+        x (Plan): the plan
+        journal (pathlib.Path, optional): the undo journal. Defaults to None.
+        jobs (int, optional): the threads that copy the files across the file
+        systems. Defaults to 4.
+    """
+    for f in x.deletes:
+        f.unlink()
+    pending = list(x.rmdirs)  # the deepest first
+    removed = set(pending)
+    with contextlib.ExitStack() as stack:
+        log = stack.enter_context(open(journal, "a")) if journal else None
+        executor = stack.enter_context(
+            concurrent.futures.ThreadPoolExecutor(max(jobs, 1))
+        )
+        futures: dict[concurrent.futures.Future, Move] = {}
 
-def simplify(tgt: str, rm_empty_folder: bool):
+        def record(m: Move) -> None:
+            if log is not None:
+                log.write(json.dumps({"src": str(m.src), "dst": str(m.dst)}) + "\n")
+                log.flush()
+
+        def wait() -> None:
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+                record(futures[future])
+            futures.clear()
+
+        for m in x.moves:
+            if m.dst in removed:
+                # the name of a removed folder is taken only after all of its files
+                # are planned to move out, so it can be removed once they're done
+                wait()
+                for d in [d for d in pending if d == m.dst or m.dst in d.parents]:
+                    d.rmdir()
+                    pending.remove(d)
+                removed.discard(m.dst)
+            if m.cross_device:
+                futures[executor.submit(move, m)] = m
+            else:
+                move(m)
+                record(m)
+        wait()
+    for d in pending:
+        d.rmdir()
+
+
+def undo(journal: pathlib.Path) -> int:
+    """move the files back in the reverse order, return the number of moves
+
+    The removed folders are made again, but the deleted `.DS_Store` are not back.
+    """
+    moves = [json.loads(x) for x in journal.read_text().splitlines() if x]
+    for x in reversed(moves):
+        src, dst = pathlib.Path(x["src"]), pathlib.Path(x["dst"])
+        src.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(dst, src)
+    journal.unlink()
+    return len(moves)
+
+
+def simplify(
+    tgt: str,
+    rm_empty_folder: bool,
+    dry_run: bool = False,
+    journal: Optional[pathlib.Path] = None,
+    depth: Optional[int] = 1,
+    jobs: int = 4,
+) -> Plan:
     """Simplify the file tree
 
     Args:
         tgt (str): the directory to be simplified
         rm_empty_folder (bool): whether the empty folder to be removed or not
+        dry_run (bool, optional): only plan the moves. Defaults to False.
+        journal (pathlib.Path, optional): the file that records the moves for
+        `undo()`. Defaults to None, i.e., no record.
+        depth (int, optional): the levels of folders to be flattened, None for
+        all. Defaults to 1.
+        jobs (int, optional): the threads that copy the files across the file
+        systems. Defaults to 4.
+
+    Returns:
+        Plan: the moves planned (and done if not `dry_run`)
     """
-    target = pathlib.Path(tgt)
-    for entry in target.iterdir():
-        if entry.is_dir():
-            for f in entry.iterdir():
-                if f.name == ".DS_Store":
-                    f.unlink()
-                    continue
-                fname = f.name
-                while (dest := target / fname).exists():
-                    fname = "0_" + fname
-                f.rename(dest)
-            if rm_empty_folder:
-                entry.rmdir()
+    x = plan(tgt, rm_empty_folder, depth)
+    if not dry_run:
+        execute(x, journal, jobs)
+    return x
 
 
 def main() -> None:
@@ -46,13 +271,65 @@ def main() -> None:
         default=False,
         help="Open the folder when finished",
     )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="Print the planned moves without doing them",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=1,
+        help="Flatten the folders up to this level (default 1)",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        default=False,
+        help="Flatten the folders of any depth",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=4,
+        help="The threads that copy the files across file systems (default 4)",
+    )
+    parser.add_argument(
+        "--journal",
+        help=f"The undo journal of the moves (default TARGET/{JOURNAL})",
+    )
+    parser.add_argument(
+        "--undo",
+        action="store_true",
+        default=False,
+        help="Revert the moves recorded in the journal",
+    )
     parser.add_argument("target", help="The folder to be simplified")
     options = parser.parse_args()
     target = options.target
     if len(target) == 0 or pathlib.Path(target).is_dir() is False:
         msg = f"You must provide a valid folder (current input is '{target}')"
         raise FileExistsError(msg)
-    simplify(target, not options.keepsubfolder)
+    journal = pathlib.Path(options.journal or pathlib.Path(target) / JOURNAL)
+    if options.undo:
+        if not journal.exists():
+            raise FileNotFoundError(f"No journal to undo ({journal})")
+        print(f"{undo(journal)} moves reverted.")
+        return
+    x = simplify(
+        target,
+        not options.keepsubfolder,
+        options.dry_run,
+        journal,
+        None if options.all else options.depth,
+        options.jobs,
+    )
+    if options.dry_run:
+        print(x)
+        return
     print(f"{target=} cleaned.")
     if options.open:
         # by adding the check=True, we can be sure that an error raised if it fails
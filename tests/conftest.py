@@ -0,0 +1,61 @@
+import http.server
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+from typing import Callable
+
+import pytest
+
+
+@dataclass
+class Request:
+    path: str
+    query: dict[str, list[str]]
+    headers: dict[str, str]
+    body: bytes
+    time: float
+
+
+class LocalServer(http.server.ThreadingHTTPServer):
+    """the local HTTP server of the network tests, `respond` makes the status code
+    and the body of each request"""
+
+    respond: Callable[[Request], tuple[int, bytes]]
+    requests: list[Request]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # keep-alive requires HTTP/1.1
+    protocol_version = "HTTP/1.1"
+    server: LocalServer
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        req = Request(self.path, query, dict(self.headers), body, time.monotonic())
+        self.server.requests.append(req)
+        code, out = self.server.respond(req)
+        self.send_response(code)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def local_server():
+    s = LocalServer(("127.0.0.1", 0), Handler)
+    s.respond = lambda req: (200, b"ok")
+    s.requests = []
+    threading.Thread(target=s.serve_forever, daemon=True).start()
+    yield s
+    s.shutdown()
+    s.server_close()
@@ -0,0 +1,219 @@
+import crawl_zhongbaodeng_site as cz
+import pytest
+import pathlib
+import pandas as pd
+from dataclasses import dataclass, field
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures"
+
+
+def make_page(page: int, newest: int, nrows: int = 3, pager: bool = False) -> str:
+    """the html of the registry page in the markup of the website
+
+    The products are numbered from 1 to `newest`, the latest registered first.
+    """
+    lis = []
+    for i in range(nrows):
+        n = newest - (page - 1) * nrows - i
+        if n > 0:
+            lis.append(
+                "<li>"
+                f"<div> {(page - 1) * nrows + i + 1} </div>"
+                f"<div>资产管理公司{n}</div>"
+                f"<div>ZH{n:06d}</div>"
+                f"<div>组合类产品{n}号</div>"
+                f"<div>2023-01-{n:02d}</div>"
+                "</li>"
+            )
+    return (
+        "<html><body>"
+        '<div class="product_content_content product_content_content1">'
+        f"<ul>{''.join(lis)}</ul>"
+        "</div>"
+        + (f'<div class="page">共 {-(-newest // nrows)} 页</div>' if pager else "")
+        + "</body></html>"
+    )
+
+
+@dataclass
+class Site:
+    """the registry of the website served by the local server"""
+
+    url: str
+    newest: int = 15
+    pager: bool = False
+    # serve the last page for any page beyond it
+    clamp: bool = False
+    # the number of failed responses of each page, with the status code `status`
+    fails: dict[int, int] = field(default_factory=dict)
+    status: int = 503
+    maintenance: bool = False
+    requests: list[tuple[int, float]] = field(default_factory=list)
+
+    def respond(self, req) -> tuple[int, bytes]:
+        page = int(req.query["currentPage"][0])
+        self.requests.append((page, req.time))
+        if self.fails.get(page, 0) > 0:
+            self.fails[page] -= 1
+            return self.status, b""
+        if self.maintenance:
+            return 200, "<html><body><div>系统维护中</div></body></html>".encode()
+        if self.clamp:
+            page = min(page, max(-(-self.newest // 3), 1))
+        return 200, make_page(page, self.newest, pager=self.pager).encode()
+
+
+@pytest.fixture
+def server(local_server):
+    site = Site(local_server.url + "channel/zbd.html")
+    local_server.respond = site.respond
+    return site
+
+
+def test_read_tbl(server):
+    df = cz.read_tbl(2, server.url)
+    assert df is not None
+    assert list(df["产品登记编码"]) == ["ZH000012", "ZH000011", "ZH000010"]
+    assert list(df["序号"]) == ["4", "5", "6"]
+
+
+def test_read_tbls(server):
+    server.fails = {2: 2}
+    tbls = cz.read_tbls([1, 2, 3, 4, 5], jobs=3, backoff=0.01, url=server.url)
+    codes = [x["产品登记编码"].iloc[0] for x in tbls if x is not None]
+    assert codes == ["ZH000015", "ZH000012", "ZH000009", "ZH000006", "ZH000003"]
+    assert [x[0] for x in server.requests].count(2) == 3
+
+    server.fails = {1: 5}
+    with pytest.raises(cz.requests.HTTPError):
+        cz.read_tbls([1], retries=1, backoff=0.01, url=server.url)
+
+    # the client errors are not retried
+    server.fails, server.status, server.requests = {1: 1}, 404, []
+    with pytest.raises(cz.requests.HTTPError):
+        cz.read_tbls([1], retries=3, backoff=0.01, url=server.url)
+    assert len(server.requests) == 1
+    server.fails, server.status, server.requests = {1: 1}, 429, []
+    assert cz.read_tbls([1], retries=3, backoff=0.01, url=server.url)[0] is not None
+    assert len(server.requests) == 2
+
+
+def test_read_tbls_rate_limit(server):
+    cz.read_tbls([1, 2, 3, 4, 5], jobs=5, rps=20, url=server.url)
+    times = sorted(x[1] for x in server.requests)
+    assert times[-1] - times[0] >= 4 / 20 * 0.9
+
+
+def test_crawl_incremental(server, tmp_path):
+    store = cz.Store(tmp_path / "store.db")
+    # the first crawl stops at the empty page
+    assert cz.crawl_incremental(store, jobs=2, url=server.url) == 15
+    assert sorted(x[0] for x in server.requests) == [1, 2, 3, 4, 5, 6]
+
+    # only the pages until the whole known page are fetched
+    server.newest = 19
+    server.requests = []
+    assert cz.crawl_incremental(store, url=server.url) == 4
+    assert [x[0] for x in server.requests] == [1, 2, 3]
+    df = store.read()
+    assert len(df) == 19
+    assert list(df["产品登记编码"][:2]) == ["ZH000019", "ZH000018"]
+
+    server.requests = []
+    assert cz.crawl_incremental(store, url=server.url) == 0
+    assert [x[0] for x in server.requests] == [1]
+    store.close()
+
+
+def test_find_total_page_limit(server):
+    server.newest = 10**6
+    total, fetched = cz.find_total_page(url=server.url, max_pages=20)
+    assert total == 20
+    assert max(fetched) == 20
+    assert len(server.requests) <= 2 * 5
+
+
+@pytest.mark.parametrize("newest", [1, 3, 4, 14, 15, 16, 24, 100])
+def test_find_total_page_clamp(server, newest):
+    server.newest, server.clamp = newest, True
+    last = -(-newest // 3)
+    total, fetched = cz.find_total_page(url=server.url)
+    assert total == last
+    assert max(fetched) == last
+    assert len(server.requests) <= 2 * (last.bit_length() + 1)
+
+    # no wasted or missed pages
+    server.requests = []
+    df = cz.crawl(url=server.url)
+    assert df["产品登记编码"].is_unique
+    assert len(df) == newest
+    pages = [x[0] for x in server.requests]
+    assert len(pages) == len(set(pages))
+
+
+def test_parse_total_page():
+    assert cz.parse_total_page(make_page(1, 15, pager=True)) == 5
+    assert cz.parse_total_page("<script>var totalPage = '42';</script>") == 42
+    assert cz.parse_total_page(make_page(1, 15)) is None
+
+
+@pytest.mark.parametrize("newest", [0, 3, 14, 15, 16, 100])
+def test_crawl(server, newest):
+    server.newest = newest
+    df = cz.crawl(url=server.url)
+    assert len(df) == newest
+    # no page is fetched twice and the last page is not missed
+    pages = [x[0] for x in server.requests]
+    assert len(pages) == len(set(pages))
+
+    server.pager = True
+    server.requests = []
+    df = cz.crawl(jobs=2, url=server.url)
+    assert len(df) == newest
+    assert sorted(x[0] for x in server.requests) == list(
+        range(1, max(-(-newest // 3), 1) + 1)
+    )
+
+
+def test_parse_tbl_fixture():
+    html = (FIXTURES / "zbd_registry_page.html").read_text(encoding="utf-8")
+    df = cz.parse_tbl(html)
+    assert df is not None
+    assert len(df) == 20
+    assert df["序号"].iloc[0] == "21"
+    pd.testing.assert_frame_equal(df, cz.parse_tbl_bs4(html))
+    assert cz.parse_total_page(html) == 152
+    assert cz.parse_tbl("<html><body><div>maintenance</div></body></html>") is None
+    assert cz.parse_tbl("") is None
+
+
+def test_response_cache(server, tmp_path):
+    cache = cz.ResponseCache(tmp_path / "cache.db", ttl=60)
+    server.pager = True
+    server.fails = {3: 10}
+    # the crawl fails halfway
+    with pytest.raises(cz.requests.HTTPError):
+        cz.crawl(retries=0, url=server.url, cache=cache)
+
+    # the re-run only fetches the missing pages
+    server.fails = {}
+    server.requests = []
+    assert len(cz.crawl(url=server.url, cache=cache)) == 15
+    pages = [x[0] for x in server.requests]
+    assert 3 in pages and 1 not in pages and 2 not in pages
+    server.requests = []
+    assert len(cz.crawl(jobs=3, url=server.url, cache=cache)) == 15
+    assert server.requests == []
+
+    # the expired pages are fetched again
+    cache.ttl = 0
+    assert len(cz.crawl(5, url=server.url, cache=cache)) == 15
+    assert sorted(x[0] for x in server.requests) == [1, 2, 3, 4, 5]
+
+    # the pages without the table are not cached
+    cache.ttl = None
+    server.maintenance = True
+    assert cz.parse_tbl(cz.fetch_page(6, server.url, cache=cache)) is None
+    assert cache.get(server.url, 6) is None
+    assert cache.get(server.url, 5) is not None
+    cache.close()
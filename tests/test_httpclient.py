@@ -0,0 +1,44 @@
+import httpclient
+import pytest
+
+
+@pytest.fixture
+def server(local_server):
+    """the server that answers 503 for the first `fails` requests"""
+    local_server.fails = 0
+
+    def respond(req):
+        if local_server.fails > 0:
+            local_server.fails -= 1
+            return 503, b"busy"
+        return 200, b"ok"
+
+    local_server.respond = respond
+    return local_server.url, local_server
+
+
+def encodings(s):
+    return [x.headers.get("Accept-Encoding", "") for x in s.requests]
+
+
+def test_client_reuse(server):
+    url, s = server
+    with httpclient.Client() as client:
+        for i in range(3):
+            assert client.post(url, data={"i": i}).text == "ok"
+        stats = client.stats()
+    assert (stats.requests, stats.connections, stats.reused) == (3, 1, 2)
+    assert stats.latency > 0
+    assert encodings(s) == ["gzip, deflate"] * 3
+
+
+def test_client_retries(server):
+    url, s = server
+    s.fails = 2
+    with httpclient.Client(retries=3, backoff=0.01, compress=False) as client:
+        assert client.post(url).status_code == 200
+    assert encodings(s) == ["identity"] * 3
+
+    s.fails = 2
+    with httpclient.Client(retries=0) as client:
+        assert client.post(url).status_code == 503
@@ -2,6 +2,9 @@ import read_nav_from_excel as rd
 from datetime import date
 import pytest
 import re
+import io
+import zipfile
+import pandas as pd
 
 
 def test_parse_date():
@@ -23,3 +26,130 @@ def test_find_nav():
         LookupError, match=re.escape(r"['当天单位净值：', '累计单位净值：']")
     ):
         rd.find_nav(indexes2, values, nms)
+
+
+def test_parse_nav_layouts():
+    def make_content(ref_date: str, nav: str, nav_acc: str, pad: int = 0):
+        return pd.DataFrame(
+            {
+                "XX资产管理产品估值表": ["估值日期：" + ref_date]
+                + ["科目"] * pad
+                + ["今日单位净值：", "累计单位净值："],
+                "Unnamed: 1": [None] + ["-"] * pad + [nav, nav_acc],
+            }
+        )
+
+    nms = ("(今日|基金)单位净值", "累计单位净值")
+    layouts: rd.Layouts = {}
+    out = rd.parse_nav(make_content("2021-12-30", "1.1", "2.1"), (10, 0), nms, layouts)
+    assert out == rd.Nav(date(2021, 12, 30), 1.1, 2.1)
+    assert list(layouts.values()) == [rd.Layout(0, 1, 2)]
+
+    # the same fingerprint reads the known cells directly
+    out = rd.parse_nav(make_content("2021-12-31", "1.2", "2.2"), (10, 0), nms, layouts)
+    assert out == rd.Nav(date(2021, 12, 31), 1.2, 2.2)
+
+    # fall back to the full scan when validation fails and learn the new layout
+    content = make_content("2022-01-04", "1.3", "2.3", pad=2)
+    out = rd.parse_nav(content, (10, 0), nms, layouts)
+    assert out == rd.Nav(date(2022, 1, 4), 1.3, 2.3)
+    assert list(layouts.values()) == [rd.Layout(0, 3, 4)]
+
+
+def excel_bytes(ref_date: str, nav: float, nav_acc: float) -> bytes:
+    buf = io.BytesIO()
+    df = pd.DataFrame(
+        {
+            "估值表": ["估值日期：" + ref_date, "今日单位净值：", "累计单位净值："],
+            "Unnamed: 1": [None, nav, nav_acc],
+        }
+    )
+    df.to_excel(buf, index=False, engine="xlsxwriter")
+    return buf.getvalue()
+
+
+def test_read_navs_from_zip(tmp_path):
+    with zipfile.ZipFile(tmp_path / "a.zip", "w") as zf:
+        zf.writestr("sub/20211231.xlsx", excel_bytes("2021-12-31", 1.2, 2.2))
+        zf.writestr("20211230.xlsx", excel_bytes("2021-12-30", 1.1, 2.1))
+        zf.writestr("readme.txt", "not an excel")
+        zf.writestr("__MACOSX/._20211230.xlsx", "resource fork")
+    (tmp_path / "20220104.xlsx").write_bytes(excel_bytes("2022-01-04", 1.3, 2.3))
+
+    excels = rd.find_all_excels(str(tmp_path / "a.zip"))
+    assert [x.name for x in excels] == ["20211230.xlsx", "20211231.xlsx"]
+    excels = rd.find_all_excels(str(tmp_path))
+    assert len(excels) == 3
+
+    nms = ("(今日|基金)单位净值", "累计单位净值")
+    out = rd.read_navs(excels, (10, 0), nms)
+    assert list(out["单位净值"]) == [1.1, 1.2, 1.3]
+    assert list(out["净值日期"]) == [
+        date(2021, 12, 30),
+        date(2021, 12, 31),
+        date(2022, 1, 4),
+    ]
+
+
+@pytest.mark.parametrize("store", ["navs.parquet", "navs.db"])
+def test_watcher(tmp_path, store):
+    fromdir = tmp_path / "in"
+    fromdir.mkdir()
+    (fromdir / "20211230.xlsx").write_bytes(excel_bytes("2021-12-30", 1.1, 2.1))
+    nms = ("(今日|基金)单位净值", "累计单位净值")
+    snapshot = tmp_path / "navs.xlsx"
+    w = rd.Watcher(fromdir, tmp_path / store, (10, 0), nms, snapshot=snapshot, settle=0)
+    # the first sighting only marks the file as pending
+    assert w.poll() is None
+    out = w.poll()
+    assert out is not None
+    assert list(out["单位净值"]) == [1.1]
+    assert w.poll() is None
+
+    # the file still being written is parsed only after it settles
+    (fromdir / "20211231.xlsx").write_bytes(b"partial")
+    assert w.poll() is None
+    (fromdir / "20211231.xlsx").write_bytes(excel_bytes("2021-12-31", 1.2, 2.2))
+    assert w.poll() is None
+    out = w.poll()
+    assert out is not None
+    assert list(out["单位净值"]) == [1.1, 1.2]
+    assert list(pd.read_excel(snapshot)["累计单位净值"]) == [2.1, 2.2]
+
+    # the ingested files are skipped after restart
+    w = rd.Watcher(fromdir, tmp_path / store, (10, 0), nms, settle=0)
+    assert w.poll() is None
+    assert w.poll() is None
+    assert list(rd.load_store(tmp_path / store)["净值日期"]) == [
+        date(2021, 12, 30),
+        date(2021, 12, 31),
+    ]
+
+
+def test_watcher_bad_file(tmp_path):
+    fromdir = tmp_path / "in"
+    fromdir.mkdir()
+    (fromdir / "bad.zip").write_bytes(b"not a zip")
+    (fromdir / "20211230.xlsx").write_bytes(excel_bytes("2021-12-30", 1.1, 2.1))
+    nms = ("(今日|基金)单位净值", "累计单位净值")
+    w = rd.Watcher(fromdir, tmp_path / "navs.parquet", (10, 0), nms, settle=0)
+    assert w.poll() is None
+    # the broken archive is logged and skipped, the others are still ingested
+    out = w.poll()
+    assert out is not None
+    assert list(out["单位净值"]) == [1.1]
+    assert fromdir / "bad.zip" not in w.seen
+    assert fromdir / "20211230.xlsx" in w.seen
+
+    # the failed file is not tried again until it changes, and nothing is written
+    store = tmp_path / "navs.parquet"
+    mtime = store.stat().st_mtime_ns
+    ingested = []
+    ingest = w.ingest
+    w.ingest = lambda files: ingested.append(sorted(files)) or ingest(files)
+    assert [w.poll(), w.poll(), w.poll()] == [None, None, None]
+    assert ingested == []
+    (fromdir / "bad.zip").write_bytes(b"still not a zip")
+    assert [w.poll(), w.poll()] == [None, None]
+    assert ingested == [[fromdir / "bad.zip"]]
+    assert store.stat().st_mtime_ns == mtime
@@ -1,4 +1,7 @@
 import read_zhongbaodeng_report as rp
+import bench_read_zhongbaodeng_report as bench
+import pandas as pd
+import pytest
 
 
 def test_rm_space():
@@ -8,3 +11,154 @@ def test_rm_space():
     input = r"大家资产- 稳健精选 6号(第五期)集合资产管理产品 20170421 2.83% 137.00 大家资产管理有限责任公司"
     out = r"大家资产-稳健精选6号(第五期)集合资产管理产品 20170421 2.83% 137.00 大家资产管理有限责任公司"
     assert rp.rm_space(input) == out
+
+
+def make_pdf(path, pages: list[str]) -> None:
+    """write a pdf with one line of text per page"""
+    bench.write_pdf(path, [[txt] for txt in pages])
+
+
+def test_split_chunks():
+    assert rp.split_chunks([1, 2, 3, 4, 5], 2) == [[1, 2, 3], [4, 5]]
+    assert rp.split_chunks([1, 2], 4) == [[1], [2]]
+    assert rp.split_chunks([], 3) == [[]]
+
+
+def test_extract_texts(tmp_path):
+    pdf = tmp_path / "test.pdf"
+    make_pdf(pdf, [f"page{i}" for i in range(1, 8)])
+    expected = [(i, f"page{i}") for i in range(1, 8)]
+    assert rp.extract_texts(pdf) == expected
+    assert rp.extract_texts(pdf, jobs=3) == expected
+    assert rp.extract_texts(pdf, [7, 2, 9, 3], jobs=2) == [
+        (2, "page2"),
+        (3, "page3"),
+        (7, "page7"),
+    ]
+
+
+def test_parse_page():
+    raw = "\n".join(
+        [
+            "开放式组合类资管产品清单（混合类）½ö¹©°²Áª×Ê²ú²Î¿¼",
+            "产品全称 产品成立时间 期末累计单位净值(元/份) 当月累计单位净值增长率 "
+            "年初以来累计单位净值增长率 期末净资产(亿元) 产品管理机构",
+            "平安资产如意 18号资产管理产品 20150508 1.0903 -0.73% -2.92% 31.94 "
+            "平安资产管理有限责任公司",
+            "大家资产- 稳健精选 6号(第五期)集合资产管理产品 20170421 2.83% 137.00 "
+            "大家资产管理有限责任公司",
+            "某某资产管理产品 20200101 - - - 1.00 某某资产管理有限公司",
+        ]
+    )
+    cols: dict[str, list] = {col: [] for col in rp.COLS}
+    assert rp.parse_page(raw, cols) == 3
+    df = pd.DataFrame(cols)
+    assert list(df["产品全称"]) == [
+        "平安资产如意18号资产管理产品",
+        "大家资产-稳健精选6号(第五期)集合资产管理产品",
+        "某某资产管理产品",
+    ]
+    assert list(df["产品成立时间"]) == [
+        pd.Timestamp("2015-05-08"),
+        pd.Timestamp("2017-04-21"),
+        pd.Timestamp("2020-01-01"),
+    ]
+    assert df["期末累计单位净值(元/份)"].iloc[0] == 1.0903
+    assert pd.isna(df["期末累计单位净值(元/份)"].iloc[1])
+    assert df["当月累计单位净值增长率"].iloc[0] == pytest.approx(-0.0073)
+    assert df["年初以来累计单位净值增长率"].iloc[1] == pytest.approx(0.0283)
+    assert pd.isna(df["年初以来累计单位净值增长率"].iloc[2])
+    assert list(df["期末净资产(亿元)"]) == [31.94, 137.0, 1.0]
+    assert list(df["产品类型"]) == ["混合类"] * 3
+
+
+def test_read_tbl(tmp_path):
+    pdf = tmp_path / "test.pdf"
+    make_pdf(
+        pdf,
+        [
+            "FundA 20150508 1.0903 -0.73% -2.92% 31.94 MgrA",
+            "FundB 20170421 2.83% 137.00 MgrB",
+        ],
+    )
+    df = rp.read_tbl(pdf, jobs=2)
+    assert list(df.columns) == rp.COLS
+    assert list(df["产品全称"]) == ["FundA", "FundB"]
+    assert list(df["期末净资产(亿元)"]) == [31.94, 137.0]
+
+
+def test_read_tbl_cache(tmp_path, monkeypatch):
+    pdf = tmp_path / "test.pdf"
+    make_pdf(
+        pdf,
+        [
+            "FundA 20150508 1.0903 -0.73% -2.92% 31.94 MgrA",
+            "FundB 20170421 2.83% 137.00 MgrB",
+        ],
+    )
+    cache = rp.PageCache(tmp_path / "cache.db")
+    expected = rp.read_tbl(pdf, cache=cache)
+
+    # neither the text nor the rows are extracted again
+    def fail(*args):
+        raise AssertionError("the pdf should not be decoded")
+
+    monkeypatch.setattr(rp, "extract_texts", fail)
+    pd.testing.assert_frame_equal(rp.read_tbl(pdf, cache=cache), expected)
+    # the rows are re-parsed from the cached text when rules change
+    monkeypatch.setattr(rp, "rules_digest", lambda: "new rules")
+    out = rp.read_tbl(pdf, [2], cache=cache)
+    pd.testing.assert_frame_equal(out, expected[1:].reset_index(drop=True))
+    monkeypatch.undo()
+
+    # the cache is invalidated when the file changes
+    make_pdf(pdf, ["FundC 20200101 - 1.00 MgrC"])
+    assert list(rp.read_tbl(pdf, cache=cache)["产品全称"]) == ["FundC"]
+    cache.close()
+
+
+def test_ingest_reports(tmp_path, monkeypatch):
+    folder = tmp_path / "reports"
+    folder.mkdir()
+    make_pdf(folder / "2023年9月组合类产品.pdf", ["FundA 20150508 - 1.00 MgrA"])
+    make_pdf(folder / "report_202310.pdf", ["FundB 20170421 - 2.00 MgrB"])
+    dataset = tmp_path / "dataset"
+    assert rp.ingest_reports(folder, dataset) == ["2023-09", "2023-10"]
+
+    make_pdf(folder / "report_202311.pdf", ["FundC 20200101 - 3.00 MgrC"])
+    parsed = []
+    read_tbl = rp.read_tbl
+    monkeypatch.setattr(rp, "read_tbl", lambda x, **kw: parsed.append(x) or read_tbl(x))
+    assert rp.ingest_reports(folder, dataset) == ["2023-11"]
+    assert parsed == [folder / "report_202311.pdf"]
+
+    df = pd.read_parquet(dataset, filters=[(rp.PARTITION, ">=", "2023-10")])
+    assert sorted(df["产品全称"]) == ["FundB", "FundC"]
+    assert sorted(df[rp.PARTITION].astype(str)) == ["2023-10", "2023-11"]
+
+
+def test_report_month_cache(tmp_path, monkeypatch):
+    pdf = tmp_path / "monthly.pdf"
+    bench.write_pdf(pdf, [["2023年12月组合类产品清单"]])
+    cache = rp.PageCache(tmp_path / "cache.db")
+    assert rp.report_month(pdf, cache) == "2023-12"
+
+    # the month in the file name or the cached text needs no decoding
+    def fail(*args):
+        raise AssertionError("the pdf should not be decoded")
+
+    monkeypatch.setattr(rp, "extract_pages", fail)
+    assert rp.report_month(pdf, cache) == "2023-12"
+    assert rp.report_month(tmp_path / "report_202401.pdf") == "2024-01"
+    cache.close()
+
+
+def test_read_tbl_synthetic_report(tmp_path):
+    pdf = tmp_path / "report.pdf"
+    nrows = bench.make_report(pdf, 8, nrows=5)
+    df = rp.read_tbl(pdf)
+    assert len(df) == nrows
+    assert df["产品全称"].str.contains(" ").sum() == 0
+    assert df["产品管理机构"].str.endswith("资产管理有限责任公司").all()
+    assert list(df["产品类型"].value_counts().sort_index()) == [10] * 4
+    assert df.loc[df["产品类型"] == "货币类", "期末累计单位净值(元/份)"].isna().all()
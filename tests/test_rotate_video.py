@@ -0,0 +1,192 @@
+import rotate_video as rv
+import json
+import os
+import sys
+import time
+import pathlib
+import pytest
+
+# records the arguments, then copies the input to the output slowly
+FAKE_FFMPEG = """#!{python}
+import json, os, pathlib, shutil, sys, time
+args = sys.argv[1:]
+src = pathlib.Path(args[args.index("-i") + 1])
+with open({log!r}, "a") as f:
+    f.write(json.dumps(args) + "\\n")
+if "verbose" in src.name:
+    # more than a pipe buffer before any progress
+    sys.stderr.write("x" * 200000)
+if ("bad" in src.name and os.path.exists({fail!r})) or (
+    "nocopy" in src.name and "copy" in args
+):
+    sys.stderr.write("Invalid data found when processing input")
+    sys.exit(1)
+if "-progress" in args:
+    print("frame=N/A\\nfps=0.00\\nout_time_us=N/A\\nspeed=N/A\\nprogress=continue")
+    print("frame=25\\nfps=50.0\\nout_time_us=1000000\\nspeed=2.0x")
+    print("progress=continue", flush=True)
+time.sleep({delay})
+shutil.copy(src, args[-1])
+if "-progress" in args:
+    print("frame=50\\nfps=50.0\\nout_time_us=2000000\\nspeed=2.0x\\nprogress=end")
+"""
+# the files named like `rot90` are rotated by the display matrix already
+FAKE_FFPROBE = """#!/bin/sh
+case "$*" in
+    *rotation*) case "$*" in *rot90*) echo -90 ;; esac ;;
+    *) echo 2.000000 ;;
+esac
+"""
+
+
+@pytest.fixture
+def ffmpeg(tmp_path, monkeypatch):
+    """a fake ffmpeg in PATH, returns the log of the calls"""
+    bin = tmp_path / "bin"
+    bin.mkdir()
+    log = tmp_path / "ffmpeg.log"
+    fail = tmp_path / "fail"
+    fail.touch()
+    exe = bin / "ffmpeg"
+    exe.write_text(
+        FAKE_FFMPEG.format(
+            python=sys.executable, log=str(log), fail=str(fail), delay=0.5
+        )
+    )
+    exe.chmod(0o755)
+    (bin / "ffprobe").write_text(FAKE_FFPROBE)
+    (bin / "ffprobe").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin}{os.pathsep}{os.environ['PATH']}")
+    return log
+
+
+def make_videos(folder: pathlib.Path, names: list[str]) -> list[pathlib.Path]:
+    folder.mkdir()
+    for nm in names:
+        (folder / nm).write_bytes(nm.encode())
+    return rv.get_files(str(folder))
+
+
+def calls(log: pathlib.Path) -> list[list[str]]:
+    return [json.loads(x) for x in log.read_text().splitlines()]
+
+
+def test_thread_budget(monkeypatch):
+    monkeypatch.setattr(rv.os, "cpu_count", lambda: 16)
+    assert rv.thread_budget(1) is None
+    assert rv.thread_budget(4) == 4
+    assert rv.thread_budget(5) == 3
+    assert rv.thread_budget(32) == 1
+
+
+def test_rotate_jobs(tmp_path, ffmpeg, monkeypatch):
+    monkeypatch.setattr(rv.os, "cpu_count", lambda: 8)
+    files = make_videos(tmp_path / "in", [f"{i}.mp4" for i in range(4)])
+    start = time.monotonic()
+    rv.rotate(files, tmp_path / "out", "ultrafast", 2, jobs=4, reencode=True)
+    # the four 0.5s conversions run at once
+    assert time.monotonic() - start < 1.5
+    assert [x.name for x in rv.get_files(str(tmp_path / "out"))] == [
+        f"{i}.mp4" for i in range(4)
+    ]
+    for args in calls(ffmpeg):
+        assert args[args.index("-threads") + 1] == "2"
+        assert args[args.index("-vf") + 1] == "transpose=2"
+
+
+def test_rotate_failures(tmp_path, ffmpeg):
+    files = make_videos(tmp_path / "in", ["a.mp4", "bad.mp4", "c.mp4"])
+    with pytest.raises(RuntimeError, match="1 of 3 files failed: bad.mp4"):
+        rv.rotate(files, tmp_path / "out", "ultrafast", 1, jobs=2, reencode=True)
+    # the other files are still done
+    assert [x.name for x in rv.get_files(str(tmp_path / "out"))] == ["a.mp4", "c.mp4"]
+    assert all("-threads" in x for x in calls(ffmpeg))
+    assert all(x[0] == "-nostdin" for x in calls(ffmpeg))
+
+
+def test_run_ffmpeg_stderr(tmp_path, ffmpeg):
+    src = tmp_path / "verbose.mp4"
+    src.write_bytes(b"x")
+    out = tmp_path / "out.mp4"
+    cmd = rv.ffmpeg_cmd(src, out, "ultrafast", 1)
+    assert rv.run_ffmpeg(cmd, out, rv.Progress(src.name), lambda x: None) is None
+    assert out.read_bytes() == b"x"
+
+
+def test_rotate_copy(tmp_path, ffmpeg, capsys):
+    names = ["a.mp4", "b.MOV", "c.mkv", "nocopy.mp4", "rot90.mp4"]
+    files = make_videos(tmp_path / "in", names)
+    rv.rotate(files, tmp_path / "out", "ultrafast", 1)
+    assert len(rv.get_files(str(tmp_path / "out"))) == 5
+    methods, rotations = {}, {}
+    for args in calls(ffmpeg):
+        src = pathlib.Path(args[args.index("-i") + 1]).name
+        methods.setdefault(src, []).append("copy" if "copy" in args else "encode")
+        if "copy" in args:
+            rotations[src] = args[args.index("-display_rotation") + 1]
+            assert "libx264" not in args
+    assert methods == {
+        "a.mp4": ["copy"],
+        "b.MOV": ["copy"],
+        "c.mkv": ["encode"],
+        # falls back to re-encoding when the copy fails
+        "nocopy.mp4": ["copy", "encode"],
+        "rot90.mp4": ["copy"],
+    }
+    # the transpose is added to the rotation of the clip
+    assert rotations == {
+        "a.mp4": "-90",
+        "b.MOV": "-90",
+        "nocopy.mp4": "-90",
+        "rot90.mp4": "-180",
+    }
+    stdout = capsys.readouterr().out
+    assert "nocopy.mp4: the lossless copy failed (Invalid data" in stdout
+    assert not rv.can_copy(files[0], 0)
+    assert rv.copy_cmd(files[0], files[0], 2, 90)[2] == "-180"
+    assert rv.copy_cmd(files[0], files[0], 2, -90)[2] == "0"
+    assert rv.copy_cmd(files[0], files[0], 2, 180)[2] == "-90"
+
+
+def test_rotate_resume(tmp_path, ffmpeg, capsys):
+    files = make_videos(tmp_path / "in", ["a.mp4", "bad.mp4", "c.mkv"])
+    out = tmp_path / "out"
+    with pytest.raises(RuntimeError):
+        rv.rotate(files, out, "ultrafast", 1, jobs=3)
+    assert sorted(x.name for x in out.iterdir()) == [rv.JOURNAL, "a.mp4", "c.mkv"]
+    stdout = capsys.readouterr().out
+    assert "c.mkv: 50% fps=50.0 speed=2.00x ETA 0s" in stdout
+    assert "c.mkv: 100% fps=50.0 speed=2.00x ETA 0s" in stdout
+
+    # the restart only rotates the unfinished and the changed files
+    (tmp_path / "fail").unlink()
+    ffmpeg.unlink()
+    (files[2]).write_bytes(b"changed")
+    rv.rotate(files, out, "ultrafast", 1, jobs=3)
+    assert sorted(x[x.index("-i") + 1] for x in calls(ffmpeg)) == [
+        str(files[1]),
+        str(files[2]),
+    ]
+    assert (out / "c.mkv").read_bytes() == b"changed"
+    assert not list(out.glob(".*.part*"))
+
+    ffmpeg.unlink()
+    rv.rotate(files, out, "ultrafast", 1)
+    assert not ffmpeg.exists()
+
+    # a non-empty folder that's not of a batch
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "x.mp4").touch()
+    with pytest.raises(FileExistsError):
+        rv.rotate(files, tmp_path / "other", "ultrafast", 1)
+
+
+def test_progress():
+    x = rv.Progress("a.mp4", 10.0)
+    lines = ["frame=N/A", "out_time_us=N/A", "speed=N/A", "progress=continue"]
+    assert [x.feed(line) for line in lines] == [False, False, False, True]
+    assert x.eta() is None
+    for line in ["frame=100", "fps=25.5", "out_time_us=4000000", "speed=2x"]:
+        x.feed(line + "\n")
+    assert x.eta() == pytest.approx(3)
+    assert str(x) == "a.mp4: 40% fps=25.5 speed=2.00x ETA 3s"
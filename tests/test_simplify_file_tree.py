@@ -1,4 +1,9 @@
-from simplify_file_tree import simplify
+import errno
+import pathlib
+import threading
+import time
+import simplify_file_tree as sft
+from simplify_file_tree import Move, Names, plan, simplify, undo
 
 
 def test_simiplify(tmp_path):
@@ -20,3 +25,184 @@ def test_simiplify(tmp_path):
     assert (tmp_path / "folder2") in files
     assert (tmp_path / "0_file1") in files
     assert (tmp_path / "0_0_file1") in files
+
+
+def make_tree(root, paths):
+    for p in paths:
+        (root / p).parent.mkdir(parents=True, exist_ok=True)
+        (root / p).write_text(p)
+
+
+def snapshot(root):
+    return sorted(
+        (str(p.relative_to(root)), p.read_text() if p.is_file() else None)
+        for p in root.rglob("*")
+    )
+
+
+def test_plan_dry_run(tmp_path):
+    make_tree(tmp_path, ["a/x", "a/.DS_Store", "b/x", "x", "c/a"])
+    before = snapshot(tmp_path)
+    plan = simplify(str(tmp_path), True, dry_run=True)
+    assert snapshot(tmp_path) == before
+    assert [
+        (m.src.relative_to(tmp_path).as_posix(), m.dst.name) for m in plan.moves
+    ] == [
+        ("a/x", "0_x"),
+        ("b/x", "0_0_x"),
+        # the name of the removed folder `a` is free again
+        ("c/a", "a"),
+    ]
+    assert plan.deletes == [tmp_path / "a" / ".DS_Store"]
+    assert "rmdir" in str(plan)
+
+    simplify(str(tmp_path), True)
+    assert snapshot(tmp_path) == [
+        ("0_0_x", "b/x"),
+        ("0_x", "a/x"),
+        ("a", "c/a"),
+        ("x", "x"),
+    ]
+
+
+def test_many_collisions(tmp_path, monkeypatch):
+    n = 300
+    make_tree(tmp_path, [f"cam{i:03d}/IMG_0001.JPG" for i in range(n)])
+
+    # no stat call per file to find a free name
+    def exists(self):
+        raise AssertionError("Path.exists() is called")
+
+    monkeypatch.setattr(pathlib.Path, "exists", exists)
+    plan = simplify(str(tmp_path), True, dry_run=True)
+    names = [m.dst.name for m in plan.moves]
+    assert len(set(names)) == n
+    assert names[2] == "0_0_IMG_0001.JPG"
+    assert names[4] == "IMG_0001_1.JPG"
+    assert names[-1] == "IMG_0001_296.JPG"
+    assert max(len(x) for x in names) == len("0_0_0_IMG_0001.JPG")
+
+
+def test_many_collisions_execute(tmp_path):
+    n = 300
+    long = "x" * 250 + ".JPG"
+    paths = [f"cam{i:03d}/{nm}" for i in range(n) for nm in ["IMG_0001.JPG", long]]
+    make_tree(tmp_path / "root", paths)
+    journal = tmp_path / "journal.jsonl"
+    simplify(str(tmp_path / "root"), True, journal=journal)
+    names = [p.name for p in (tmp_path / "root").iterdir()]
+    assert len(names) == 2 * n
+    assert all(len(x.encode()) <= sft.NAME_MAX for x in names)
+    assert undo(journal) == 2 * n
+    assert sorted(x[1] for x in snapshot(tmp_path / "root") if x[1]) == sorted(paths)
+
+
+def test_undo(tmp_path):
+    root = tmp_path / "root"
+    make_tree(root, ["file1", "folder1/folder1", "folder1/file2", "folder3/file1"])
+    (root / "folder1" / "folder2").mkdir()
+    before = snapshot(root)
+    journal = tmp_path / "journal.jsonl"
+    simplify(str(root), True, journal=journal)
+    assert snapshot(root) != before
+    assert undo(journal) == 4
+    assert snapshot(root) == before
+    assert not journal.exists()
+
+
+def test_names_release():
+    names = Names({"a", "x"})
+    assert [names.take("a"), names.take("a")] == ["0_a", "0_0_a"]
+    names.release("a")
+    assert names.take("a") == "a"
+    names.release("0_a")
+    assert names.take("a") == "0_a"
+    assert names.take("a") == "0_0_0_a"
+    assert names.take("a") == "a_1"
+    names.release("a_1")
+    assert names.take("a") == "a_1"
+    assert Names.candidate("a.tar.gz", 5) == "a.tar_2.gz"
+    assert len(Names.candidate("x" * 254, 1).encode()) == sft.NAME_MAX
+
+
+def test_depth(tmp_path):
+    paths = ["a/x", "a/b/y", "a/b/c/z", "a/b/c/d/w", "e/x", "v"]
+    make_tree(tmp_path / "d1", paths)
+    simplify(str(tmp_path / "d1"), True)
+    assert snapshot(tmp_path / "d1") == [
+        ("0_x", "e/x"),
+        ("b", None),
+        ("b/c", None),
+        ("b/c/d", None),
+        ("b/c/d/w", "a/b/c/d/w"),
+        ("b/c/z", "a/b/c/z"),
+        ("b/y", "a/b/y"),
+        ("v", "v"),
+        ("x", "a/x"),
+    ]
+
+    make_tree(tmp_path / "d2", paths)
+    simplify(str(tmp_path / "d2"), True, depth=2)
+    assert snapshot(tmp_path / "d2") == [
+        ("0_x", "e/x"),
+        ("c", None),
+        ("c/d", None),
+        ("c/d/w", "a/b/c/d/w"),
+        ("c/z", "a/b/c/z"),
+        ("v", "v"),
+        ("x", "a/x"),
+        ("y", "a/b/y"),
+    ]
+
+    make_tree(tmp_path / "all", paths)
+    journal = tmp_path / "journal.jsonl"
+    simplify(str(tmp_path / "all"), True, journal=journal, depth=None)
+    assert [x[0] for x in snapshot(tmp_path / "all")] == [
+        "0_x",
+        "v",
+        "w",
+        "x",
+        "y",
+        "z",
+    ]
+    undo(journal)
+    assert [x[1] for x in snapshot(tmp_path / "all") if x[1]] == sorted(paths)
+
+
+def test_cross_device(tmp_path, monkeypatch):
+    make_tree(tmp_path, [f"a/{i}" for i in range(20)] + ["b/x", "c/b"])
+    x = plan(tmp_path, True)
+    # pretend that the files of `a` and `c` are on another file system
+    x.moves = [Move(m.src, m.dst, m.src.parent.name in ["a", "c"]) for m in x.moves]
+    threads = set()
+    move = sft.shutil.move
+
+    def copy(src, dst):
+        threads.add(threading.get_ident())
+        time.sleep(0.01)
+        return move(src, dst)
+
+    monkeypatch.setattr(sft.shutil, "move", copy)
+    journal = tmp_path / "journal.jsonl"
+    sft.execute(x, journal, jobs=4)
+    assert len(threads) > 1 and threading.get_ident() not in threads
+    # `c/b` takes the name of the removed `b` after `b/x` is moved out
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [str(i) for i in range(20)] + ["b", "x", "journal.jsonl"]
+    )
+    assert (tmp_path / "b").read_text() == "c/b"
+    assert len(journal.read_text().splitlines()) == 22
+
+    # a rename across the file systems falls back to the copy
+    make_tree(tmp_path, ["d/y"])
+    rename = pathlib.Path.rename
+
+    def exdev(self, target):
+        if self.name == "y":
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return rename(self, target)
+
+    monkeypatch.setattr(pathlib.Path, "rename", exdev)
+    threads.clear()
+    simplify(str(tmp_path), True)
+    assert (tmp_path / "y").read_text() == "d/y" and threads
@@ -1,9 +1,17 @@
 import writexlsx as w
+import bench_writexlsx as bench
 import pandas as pd
-from datetime import date
+from datetime import date, datetime
+from pathlib import Path
+import subprocess
+import sys
+import openpyxl
+import polars as pl
+import pyarrow as pa
+import pytest
 
 
-def test_write(tmp_path) -> None:
+def test_write(tmp_path, monkeypatch) -> None:
     df = pd.DataFrame(
         {
             "Col1": [1, 2.0, 3],
@@ -23,4 +31,291 @@ def test_write(tmp_path) -> None:
     df2.set_index("Col2")
 
     excel = tmp_path / "test.xlsx"
+    # don't launch Excel in the tests
+    calls = []
+    monkeypatch.setattr(w.subprocess, "run", lambda args: calls.append(args))
     w.write({"表1": df, "S2": df2}, excel, open=True, overwrite=True)
+    assert calls == [["open", str(excel)]]
+    # `overwrite` and `open` are still the positional arguments after the path
+    w.write(df, excel, True, False)
+    assert len(calls) == 1
+
+
+def test_write_streaming(tmp_path) -> None:
+    df = pd.DataFrame(
+        {
+            "Col1": [1, 2.5, None, 4],
+            "Col2": pd.Series(pd.date_range("2022-01-02", periods=4)),
+            "Col3": ["ABC", None, "中文", "D"],
+            "Col4": [12, 12.455, pd.NA, pd.NaT],
+        }
+    )
+    df.loc[3, "Col2"] = pd.NaT
+    excel = tmp_path / "test.xlsx"
+    w.write(df, excel, streaming=True, overwrite=True)
+    out = pd.read_excel(excel)
+    assert list(out.columns) == list(df.columns)
+    assert out["Col1"].tolist()[:2] == [1, 2.5] and pd.isna(out["Col1"][2])
+    assert out["Col2"].tolist()[:3] == df["Col2"].tolist()[:3]
+    assert pd.isna(out["Col2"][3])
+    assert out["Col3"].tolist()[2] == "中文" and pd.isna(out["Col3"][1])
+    assert out["Col4"].isna().tolist() == [False, False, True, True]
+
+    # the rows span several chunks
+    df = pd.DataFrame({"a": range(25), "b": [str(x) for x in range(25)]})
+    excel = tmp_path / "chunks.xlsx"
+    with w.xw.Workbook(excel, {"constant_memory": True}) as wb:
+        w.write_df_rows(df, wb.add_worksheet(), None, None, chunksize=7)
+    pd.testing.assert_frame_equal(pd.read_excel(excel, dtype={"b": str}), df)
+
+
+def test_write_formats(tmp_path) -> None:
+    df = pd.DataFrame(
+        {
+            "日期": pd.date_range("2022-01-02", periods=3),
+            "时间": pd.date_range("2022-01-02 09:30", periods=3, freq="h"),
+            "date": [date(2022, 1, 23), None, date(2022, 1, 24)],
+            "规模": [1234567.891, 20000.5, None],
+            "份额": pd.array([100000, None, 3], dtype="Int64"),
+            "年份": [2021, 2022, 2023],
+            "净值": [1.0123, 1.2345, 0.9876],
+            "收益率": [0.0123, -0.05, None],
+            "代码": ["A", "B", "C"],
+        }
+    )
+    fmts = {
+        "日期": "yyyy-mm-dd",
+        "时间": "yyyy-mm-dd hh:mm:ss",
+        "date": "yyyy-mm-dd",
+        "规模": "#,##0.00",
+        # the integers are not comma formatted unless asked
+        "份额": "General",
+        "年份": "General",
+        "净值": "0.0000",
+        "收益率": "0.00%",
+        "代码": "General",
+    }
+    for streaming in [False, True]:
+        excel = tmp_path / f"fmt_{streaming}.xlsx"
+        w.write(
+            df,
+            excel,
+            percent=["收益率"],
+            num_formats={"净值": "0.0000"},
+            streaming=streaming,
+        )
+        ws = openpyxl.load_workbook(excel).active
+        for j, col in enumerate(df.columns):
+            cell = ws.cell(2, j + 1)
+            assert cell.number_format == fmts[col], col
+            assert cell.border.bottom.style == "thin"
+        assert ws.cell(1, 1).font.bold
+
+    excel = tmp_path / "fmt_comma.xlsx"
+    w.write(df, excel, comma=["份额"])
+    assert openpyxl.load_workbook(excel).active["E2"].number_format == "#,##0.00"
+
+    # the same format is created only once
+    with w.xw.Workbook(tmp_path / "cache.xlsx") as wb:
+        cache = w.FormatCache(wb)
+        df2 = pd.concat([df, df.add_suffix("2")], axis=1)
+        x = w.column_fmts(w.column_num_fmts(df2), cache)
+        assert len(x) == 18 and len(cache.fmts) == 4
+        assert x[0] is x[9]
+
+
+def test_fit_widths(tmp_path) -> None:
+    df = pd.DataFrame(
+        {
+            "代码": ["A", "B", None],
+            "产品名称": ["平安资产如意1号", "ABC", None],
+            "日期": pd.date_range("2022-01-02", periods=3),
+            "规模": [1234567.891, -20000.5, None],
+            "净值": [1.0123, 0.1 + 0.2, 1],
+            "empty": [None, None, None],
+        }
+    )
+    assert w.fit_widths(df, w.column_num_fmts(df)) == [6, 17, 12, 15, 13, 7]
+
+    # a bounded sample and the longest strings are measured on large frames
+    n = 1_000_000
+    x = pd.Series(["中文" * 5] * n)
+    x[n - 1] = "中文" * 20
+    assert w.value_width(x, None) == 80
+    y = x.astype(object)
+    y[n - 1] = 10**50
+    assert w.value_width(y, None) == 51
+    assert w.value_width(x.astype("string"), None) == 80
+    tbl = pa.table({"名称": x})
+    assert w.arrow_fit_widths(tbl, [None]) == [w.fit_width("名称", 80)]
+
+    excel = tmp_path / "fit.xlsx"
+    w.write(df, excel)
+    ws = openpyxl.load_workbook(excel).active
+    assert ws.column_dimensions["B"].width == pytest.approx(17, abs=1)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_write_duplicate_columns(tmp_path, streaming) -> None:
+    df = pd.DataFrame(
+        [[1.5, "ABC", 20000.5], [2.5, "中文", None]], columns=["净值", "名称", "净值"]
+    )
+    excel = tmp_path / "dup.xlsx"
+    w.write(df, excel, streaming=streaming)
+    ws = openpyxl.load_workbook(excel).active
+    assert [c.value for c in ws[1]] == ["净值", "名称", "净值"]
+    assert [c.value for c in ws[2]] == [1.5, "ABC", 20000.5]
+    assert ws.cell(2, 3).number_format == "#,##0.00"
+    assert ws.cell(2, 1).number_format == "General"
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_write_split(tmp_path, streaming) -> None:
+    df = pd.DataFrame({"a": range(10), "b": [f"第{x}行" for x in range(10)]})
+    excel = tmp_path / "split.xlsx"
+    out = w.Manifest()
+    path = w.write(
+        {"表1": df, "S2": df.head(3)},
+        excel,
+        streaming=streaming,
+        max_rows=4,
+        manifest=out,
+    )
+    assert path == excel
+    assert [(x.sheet, x.start, x.stop) for x in out.parts] == [
+        ("表1", 0, 4),
+        ("表1_2", 4, 8),
+        ("表1_3", 8, 10),
+        ("S2", 0, 3),
+    ]
+    assert out.sheets("表1") == ["表1", "表1_2", "表1_3"]
+    sheets = pd.read_excel(excel, sheet_name=None)
+    assert list(sheets) == ["表1", "表1_2", "表1_3", "S2"]
+    for part in out.parts:
+        expected = df.iloc[part.start : part.stop].reset_index(drop=True)
+        pd.testing.assert_frame_equal(sheets[part.sheet], expected)
+
+
+def test_sheet_name_collision(tmp_path) -> None:
+    df = pd.DataFrame({"a": range(10)})
+    excel = tmp_path / "collide.xlsx"
+    with pytest.raises(ValueError, match="表1_2"):
+        w.write({"表1": df, "表1_2": df.head(2)}, excel, max_rows=4)
+    # nothing is written
+    assert not excel.exists()
+    with pytest.raises(ValueError, match="s_3"):
+        w.write({"S_3": df, "s": df}, excel, max_rows=4)
+    tbl = pa.table(df)
+    with pytest.raises(ValueError, match="t_2"):
+        w.write({"t": iter(tbl.to_batches(4)), "t_2": df.head(2)}, excel, max_rows=4)
+    w.write({"t": iter(tbl.to_batches(4)), "t_x": df.head(2)}, excel, max_rows=4)
+    assert list(pd.read_excel(excel, sheet_name=None)) == ["t", "t_2", "t_3", "t_x"]
+
+
+def test_split_sheet() -> None:
+    assert w.split_sheet("S", 0, 4) == [w.SheetPart("S", "S", 0, 0)]
+    parts = w.split_sheet("x" * 31, 9, 4)
+    assert [x.nrows for x in parts] == [4, 4, 1]
+    assert [len(x.sheet) for x in parts] == [31, 31, 31]
+    assert parts[2].sheet.endswith("_3")
+
+
+def arrow_table() -> pa.Table:
+    return pa.table(
+        {
+            "日期": pa.array([date(2022, 1, 2), None, date(2022, 1, 4)] * 3),
+            "时间": pa.array(
+                [datetime(2022, 1, 2, 9, 30), datetime(2022, 1, 3), None] * 3,
+                pa.timestamp("us"),
+            ),
+            "规模": pa.array([1234567.891, float("nan"), None] * 3),
+            "份额": pa.array([100000, None, -3] * 3, pa.int64()),
+            "名称": pa.array(["平安资产如意1号", None, "ABC"] * 3, pa.large_string()),
+            "标志": pa.array([True, False, None] * 3),
+        }
+    )
+
+
+def expected_frame(tbl: pa.Table) -> pd.DataFrame:
+    df = tbl.to_pandas()
+    df["日期"] = pd.to_datetime(df["日期"])
+    df["时间"] = df["时间"].astype("datetime64[ns]")
+    df["规模"] = df["规模"].astype(float)
+    df["份额"] = df["份额"].astype(float)
+    df["名称"] = df["名称"].where(df["名称"].notna(), float("nan"))
+    return df
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_write_arrow(tmp_path, streaming) -> None:
+    tbl = arrow_table()
+    expected = expected_frame(tbl)
+    excel = tmp_path / "arrow.xlsx"
+    sheets = {
+        "tbl": tbl,
+        "pl": pl.from_arrow(tbl),
+        "batches": iter(tbl.to_batches(max_chunksize=2)),
+        "reader": pa.RecordBatchReader.from_batches(tbl.schema, tbl.to_batches(4)),
+    }
+    out = w.Manifest()
+    w.write(sheets, excel, streaming=streaming, max_rows=5, manifest=out)
+    assert [(x.name, x.sheet, x.start, x.stop) for x in out.parts[:2]] == [
+        ("tbl", "tbl", 0, 5),
+        ("tbl", "tbl_2", 5, 9),
+    ]
+    assert [x.sheet for x in out.parts[2:]] == [
+        "pl",
+        "pl_2",
+        "batches",
+        "batches_2",
+        "reader",
+        "reader_2",
+    ]
+    dfs = pd.read_excel(excel, sheet_name=None)
+    for nm in sheets:
+        df = pd.concat([dfs[x] for x in out.sheets(nm)], ignore_index=True)
+        df["标志"] = df["标志"].astype(object).where(df["标志"].notna(), None)
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+    ws = openpyxl.load_workbook(excel)["tbl"]
+    fmts = ["yyyy-mm-dd", "yyyy-mm-dd hh:mm:ss", "#,##0.00", "General", "General"]
+    assert [ws.cell(2, j + 1).number_format for j in range(5)] == fmts
+    assert ws.column_dimensions["E"].width == pytest.approx(17, abs=1)
+
+
+def test_write_arrow_empty(tmp_path) -> None:
+    excel = tmp_path / "empty.xlsx"
+    schema = pa.schema([("a", pa.int64()), ("b", pa.string())])
+    out = w.Manifest()
+    w.write(
+        [schema.empty_table(), pa.RecordBatchReader.from_batches(schema, [])],
+        excel,
+        streaming=True,
+        manifest=out,
+    )
+    assert [(x.sheet, x.nrows) for x in out.parts] == [("Sheet1", 0), ("Sheet2", 0)]
+    assert list(pd.read_excel(excel).columns) == ["a", "b"]
+    with pytest.raises(TypeError):
+        w.write(iter([1, 2]), tmp_path / "bad.xlsx")
+
+
+def test_write_pandas_only(tmp_path) -> None:
+    # neither polars nor pyarrow is imported when they're not installed
+    code = (
+        "import sys; sys.modules.update(polars=None, pyarrow=None)\n"
+        "import pandas as pd, writexlsx as w\n"
+        f"w.write(pd.DataFrame({{'a': [1, 2]}}), {str(tmp_path / 'pd.xlsx')!r})\n"
+    )
+    root = Path(w.__file__).parent
+    subprocess.run([sys.executable, "-c", code], cwd=root, check=True)
+    assert list(pd.read_excel(tmp_path / "pd.xlsx")["a"]) == [1, 2]
+
+
+def test_bench(tmp_path) -> None:
+    df = bench.make_frame(100)
+    assert df.shape == (100, 8) and df["产品名称"].isna().any()
+    cases = bench.bench([100], bench.MODES, isolate=False)
+    assert [x["mode"] for x in cases] == bench.MODES
+    assert all(x["rows/sec"] > 0 and x["peak_mb"] > 0 for x in cases)
+    report = bench.make_report(cases)
+    assert len(bench.compare(cases, report)) == 3
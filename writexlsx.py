@@ -14,47 +14,114 @@ be set accordingly.
    auto-detecting
 1. Support multiple Dataframe in `list`, `tuple` or `dict` to be written
    as multiple worksheets or horizontally aligned
+1. Support the polars Dataframe, the Arrow table and RecordBatch natively,
+   without converting to pandas
 1. Support to set the Excel's table style
 1. Support to write to tmp file with proper name then open in MS Excel, which is
    quite convinient when exploring data
-1. Set proper column width for date, datetime, long numbers, etc.
+1. Set proper column width for date, datetime, long numbers, etc. The width
+   of Chinese strings is counted correctly, which `wb.autofit()` doesn't
+1. Stream large Dataframes row by row with `streaming=True`, so the memory
+   stays flat however many rows there are
+1. Split the Dataframes beyond the Excel row limit into consecutive sheets, and
+   record the row ranges of each sheet in the optional `Manifest`
 
 ## TODO
 - We should not use `DataFrame.to_xlsx()`. It makes everything complicated.
   We should just write the cell by ourselves.
 - Be able to add Index
-- Auto fit the column and support Chinese strings, the wb.autofit() doesn't
-  work well. For date there's no padding. For CN strings, it's not correct.
 - Plan to submit to `pip` when matured
 
 ## Dependencies:
 - `xlsxwriter`: https://xlsxwriter.readthedocs.io
+- `polars` and `pyarrow` (optional) for the Arrow based input
 """
+from __future__ import annotations
 import xlsxwriter as xw
 from xlsxwriter.workbook import Worksheet
 import pandas as pd
+import numpy as np
+import itertools
 from pathlib import Path
 import subprocess
-from typing import Callable, Optional, Any
+import datetime
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional, Any, Union
 
-Dict_DF = dict[str, pd.DataFrame]
+# the pandas-only callers need neither of them
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# the Arrow based frames are written batch by batch without converting to pandas
+Arrow_DF = Union[
+    "pl.DataFrame", "pa.Table", "pa.RecordBatch", Iterable["pa.RecordBatch"]
+]
+Frame = Union[pd.DataFrame, Arrow_DF]
+Dict_DF = dict[str, Frame]
 Dict_Format = Optional[dict[str, Any]]
 Wb_Format = xw.workbook.Format
 Styler = Callable[[pd.DataFrame, Worksheet, Wb_Format], None]
 
+# the number of rows converted at a time in the streaming mode
+CHUNK_ROWS = 10_000
+# the max number of rows of an Excel sheet, including the header
+EXCEL_MAX_ROWS = 1_048_576
+# the max length of an Excel sheet name
+SHEET_NAME_LEN = 31
+
+
+@dataclass(frozen=True)
+class SheetPart:
+    """the rows `[start, stop)` of the Dataframe `name` written to `sheet`"""
+
+    name: str
+    sheet: str
+    start: int
+    stop: int
+
+    @property
+    def nrows(self) -> int:
+        return self.stop - self.start
+
+
+@dataclass
+class Manifest:
+    """where the rows of each Dataframe went, filled by `write(..., manifest=)`"""
+
+    parts: list[SheetPart] = field(default_factory=list)
+
+    def sheets(self, name: str) -> list[str]:
+        """the sheets that the Dataframe `name` is written to"""
+        return [x.sheet for x in self.parts if x.name == name]
+
+
+# a reader or an iterator of RecordBatch is a single frame, unlike a list or tuple
+FRAME_TYPES: tuple[type, ...] = (pd.DataFrame, Iterator)
+if pl is not None:
+    FRAME_TYPES += (pl.DataFrame,)
+if pa is not None:
+    FRAME_TYPES += (pa.Table, pa.RecordBatch, pa.RecordBatchReader)
+
 
 def check_elem_df(x: dict) -> None:
     for v in x.values():
-        if not isinstance(v, pd.DataFrame):
+        if not isinstance(v, FRAME_TYPES):
             raise TypeError(f"all elem of df must be DataFrame, but find {type(v)}")
 
 
 def make_dict(
-    df: pd.DataFrame | Dict_DF | tuple[pd.DataFrame] | list[pd.DataFrame],
+    df: Frame | Dict_DF | tuple[Frame] | list[Frame],
 ) -> Dict_DF:
     if isinstance(df, dict):
         x = df
-    elif isinstance(df, pd.DataFrame):
+    elif isinstance(df, FRAME_TYPES):
         x = {"Sheet1": df}
     elif isinstance(df, tuple) or isinstance(df, list):
         x = {}
@@ -83,35 +150,505 @@ style_fmts: dict[str, Dict_Format] = {
     },
 }
 
+num_fmts: dict[str, str] = {
+    "date": "yyyy-mm-dd",
+    "datetime": "yyyy-mm-dd hh:mm:ss",
+    "integer": "#,##0",
+    "comma": "#,##0.00",
+    "percent": "0.00%",
+}
+
+# the number formats whose width is measured from the max/min of the column
+RANGE_FMTS = (num_fmts["integer"], num_fmts["comma"], num_fmts["percent"])
+# floats smaller than this are not comma formatted (e.g., the NAVs), the integers
+# never are unless asked (e.g., the yyyymmdd dates or the IDs)
+COMMA_THRESHOLD = 10_000
+
+
+class FormatCache:
+    """create each distinct format only once per workbook"""
+
+    def __init__(self, wb: xw.Workbook) -> None:
+        self.wb = wb
+        self.fmts: dict[tuple, Wb_Format] = {}
+
+    def get(self, props: dict[str, Any]) -> Wb_Format:
+        key = tuple(sorted(props.items()))
+        if key not in self.fmts:
+            self.fmts[key] = self.wb.add_format(props)
+        return self.fmts[key]
+
+
+def detect_num_fmt(x: pd.Series) -> Optional[str]:
+    """the number format name of `num_fmts` implied by the dtype of the column"""
+    if pd.api.types.is_bool_dtype(x):
+        return None
+    if pd.api.types.is_datetime64_any_dtype(x):
+        v = x.dropna().to_numpy()
+        has_time = v.size > 0 and bool((v != v.astype("M8[D]")).any())
+        return "datetime" if has_time else "date"
+    if pd.api.types.is_float_dtype(x):
+        top = x.abs().max()
+        if pd.isna(top) or top < COMMA_THRESHOLD:
+            return None
+        return "comma"
+    if x.dtype == object:
+        i = x.first_valid_index()
+        v = None if i is None else x[i]
+        if isinstance(v, datetime.datetime):
+            return "datetime" if v.time() != datetime.time() else "date"
+        if isinstance(v, datetime.date):
+            return "date"
+    return None
+
+
+def override_num_fmt(
+    col: str,
+    comma: Optional[list[str]] = None,
+    percent: Optional[list[str]] = None,
+    num_formats: Optional[dict[str, str]] = None,
+) -> Optional[str]:
+    """the number format specified by the user, None if not specified"""
+    if num_formats and col in num_formats:
+        return num_formats[col]
+    if percent and col in percent:
+        return num_fmts["percent"]
+    if comma and col in comma:
+        return num_fmts["comma"]
+    return None
+
+
+def column_num_fmts(
+    df: pd.DataFrame,
+    comma: Optional[list[str]] = None,
+    percent: Optional[list[str]] = None,
+    num_formats: Optional[dict[str, str]] = None,
+) -> list[Optional[str]]:
+    """the Excel number format of each column
+
+    The format is detected from the dtype, which can be overridden by `comma`,
+    `percent` or `num_formats`.
+    """
+    out = []
+    # the columns are taken by position, since the names may be duplicated
+    for j, col in enumerate(df.columns):
+        num_fmt = override_num_fmt(col, comma, percent, num_formats)
+        if num_fmt is None and (nm := detect_num_fmt(df.iloc[:, j])) is not None:
+            num_fmt = num_fmts[nm]
+        out.append(num_fmt)
+    return out
+
+
+def column_fmts(
+    col_num_fmts: list[Optional[str]], fmts: FormatCache
+) -> list[Wb_Format]:
+    """the format of each column (the cell style plus the number format), to be
+    applied by `set_column()`"""
+    out = []
+    for num_fmt in col_num_fmts:
+        props = dict(style_fmts["cell"] or {})
+        if num_fmt is not None:
+            props["num_format"] = num_fmt
+        out.append(fmts.get(props))
+    return out
+
+
+# the East Asian Wide (W) and Fullwidth (F) characters take two columns
+WIDE_CHARS = (
+    "[\u1100-\u115f\u2e80-\u303e\u3041-\u33ff\u3400-\u4dbf\u4e00-\u9fff"
+    "\ua000-\ua4cf\uac00-\ud7a3\uf900-\ufaff\ufe30-\ufe4f\uff00-\uff60"
+    "\uffe0-\uffe6]"
+)
+# at most this many cells of a text column are measured when fitting the width,
+# plus the FIT_TOP longest strings, so that a long outlier isn't missed
+FIT_ROWS = 1000
+FIT_TOP = 20
+MIN_WIDTH = 6
+MAX_WIDTH = 60
+# Excel shows at most 11 chars for a number in the General format
+GENERAL_DIGITS = 11
+
+
+def text_width(x: pd.Series) -> int:
+    """the max display width of the strings, the wide chars count as 2"""
+    x = x.dropna()
+    if x.empty:
+        return 0
+    x = x.astype(str)
+    return int((x.str.len() + x.str.count(WIDE_CHARS)).max())
+
+
+def num_width(top: Any, low: Any, num_fmt: str) -> int:
+    """the display width of the numbers within [-top, top] in the number format"""
+    if top is None or pd.isna(top):
+        return 0
+    sign = int(low < 0)
+    if num_fmt == num_fmts["percent"]:
+        return len(f"{top:.2%}") + sign
+    digits = 0 if num_fmt == num_fmts["integer"] else 2
+    return len(f"{top:,.{digits}f}") + sign
+
+
+def value_width(x: pd.Series, num_fmt: Optional[str]) -> int:
+    """the display width of the column's values in the number format
+
+    The dates and the formatted numbers are measured from the format and the
+    max/min, the others from a bounded evenly spaced sample of the cells and the
+    longest strings.
+    """
+    is_num = pd.api.types.is_numeric_dtype(x) and not pd.api.types.is_bool_dtype(x)
+    if num_fmt in (num_fmts["date"], num_fmts["datetime"]):
+        return len(num_fmt)
+    if is_num and num_fmt in RANGE_FMTS:
+        return num_width(x.abs().max(), x.min(), num_fmt)
+    if len(x) > FIT_ROWS:
+        sample = x.iloc[:: -(-len(x) // FIT_ROWS)]
+        if is_num:
+            # the width in the General format is capped anyway
+            x = sample
+        else:
+            # one cheap length pass, only the non-str cells are converted to str
+            lens = pd.Series(
+                np.fromiter(
+                    (len(v) if type(v) is str else len(str(v)) for v in x.to_numpy()),
+                    dtype=np.int64,
+                    count=len(x),
+                )
+            )
+            x = pd.concat([sample, x.iloc[lens.nlargest(FIT_TOP).index]])
+    width = text_width(x)
+    return min(width, GENERAL_DIGITS) if is_num else width
+
+
+def fit_widths(df: pd.DataFrame, col_num_fmts: list[Optional[str]]) -> list[int]:
+    """the column widths that fit the headers and the values (CJK-aware)"""
+    return [
+        fit_width(col, value_width(df.iloc[:, j], num_fmt))
+        for j, (col, num_fmt) in enumerate(zip(df.columns, col_num_fmts))
+    ]
+
+
+def fit_width(col: str, width: int) -> int:
+    """the column width that fits both the header and the values"""
+    head = text_width(pd.Series([col]))
+    return min(max(max(head, width) + 2, MIN_WIDTH), MAX_WIDTH)
+
+
+def is_arrow_num(x: pa.ChunkedArray) -> bool:
+    t = x.type
+    return pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_decimal(t)
+
+
+def arrow_num_fmt(x: pa.ChunkedArray) -> Optional[str]:
+    """the number format name of `num_fmts` implied by the Arrow type"""
+    if pa.types.is_date(x.type):
+        return "date"
+    if pa.types.is_timestamp(x.type):
+        time = pc.not_equal(x, pc.floor_temporal(x, unit="day"))
+        return "datetime" if pc.any(time).as_py() else "date"
+    if is_arrow_num(x) and not pa.types.is_integer(x.type):
+        top = pc.max(pc.abs(x)).as_py()
+        if top is None or top < COMMA_THRESHOLD:
+            return None
+        return "comma"
+    return None
+
+
+def arrow_num_fmts(
+    tbl: pa.Table,
+    comma: Optional[list[str]] = None,
+    percent: Optional[list[str]] = None,
+    num_formats: Optional[dict[str, str]] = None,
+) -> list[Optional[str]]:
+    """`column_num_fmts()` of the Arrow table, computed by Arrow kernels"""
+    out = []
+    for col, x in zip(tbl.column_names, tbl.columns):
+        num_fmt = override_num_fmt(col, comma, percent, num_formats)
+        if num_fmt is None and (nm := arrow_num_fmt(x)) is not None:
+            num_fmt = num_fmts[nm]
+        out.append(num_fmt)
+    return out
+
+
+def arrow_fit_widths(tbl: pa.Table, col_num_fmts: list[Optional[str]]) -> list[int]:
+    """`fit_widths()` of the Arrow table, only the sampled and the longest cells
+    are converted"""
+    out = []
+    for col, x, num_fmt in zip(tbl.column_names, tbl.columns, col_num_fmts):
+        is_num = is_arrow_num(x)
+        if num_fmt in (num_fmts["date"], num_fmts["datetime"]):
+            width = len(num_fmt)
+        elif is_num and num_fmt in RANGE_FMTS:
+            width = num_width(pc.max(pc.abs(x)).as_py(), pc.min(x).as_py(), num_fmt)
+        else:
+            if len(x) > FIT_ROWS:
+                rows = pa.array(range(0, len(x), -(-len(x) // FIT_ROWS)))
+                if pa.types.is_string(x.type) or pa.types.is_large_string(x.type):
+                    top = pc.top_k_unstable(pc.utf8_length(x), FIT_TOP)
+                    rows = pa.concat_arrays([rows, top.cast(rows.type)])
+                x = x.take(rows)
+            width = text_width(pd.Series(x.to_pylist(), dtype=object))
+            width = min(width, GENERAL_DIGITS) if is_num else width
+        out.append(fit_width(col, width))
+    return out
+
+
+def set_columns(
+    sheet: Worksheet,
+    ncol: int,
+    col_fmts: Optional[list[Wb_Format]],
+    widths: Optional[list[int]] = None,
+) -> None:
+    # without the fitted widths, set the column width to 12, so date can display;
+    # this can be set in wb creator via default_col_width
+    for j in range(ncol):
+        sheet.set_column(
+            j,
+            j,
+            width=widths[j] if widths else 12,
+            cell_format=col_fmts[j] if col_fmts else None,
+        )
+
 
 def write_df(
     df: pd.DataFrame,
     sheet: Worksheet,
     head_fmt: Optional[Wb_Format],
-    cell_fmt: Optional[Wb_Format],
+    col_fmts: Optional[list[Wb_Format]],
+    widths: Optional[list[int]] = None,
 ) -> None:
     # TODO: add index support
-    # column width to 12, so date can display;
-    # this can be set in wb creator via default_col_width
-    sheet.set_column(0, len(df.columns) - 1, width=12, cell_format=cell_fmt)
+    set_columns(sheet, len(df.columns), col_fmts, widths)
     # header
     for j, value in enumerate(df.columns.values):
         sheet.write(0, j, value, head_fmt)
     # content
-    for j, col in enumerate(df.columns):
-        # xlsxwriter doesn't support writting NA directly
-        sheet.write_column(1, j, df[col].fillna(""))
-    # sheet.autofit()
+    for j in range(len(df.columns)):
+        # xlsxwriter doesn't support writting NA directly, and `fillna("")`
+        # fails on the nullable dtypes like Int64
+        x = df.iloc[:, j]
+        sheet.write_column(1, j, x.astype(object).where(x.notna(), None))
+
+
+def write_df_rows(
+    df: pd.DataFrame,
+    sheet: Worksheet,
+    head_fmt: Optional[Wb_Format],
+    col_fmts: Optional[list[Wb_Format]],
+    widths: Optional[list[int]] = None,
+    chunksize: int = CHUNK_ROWS,
+) -> None:
+    """write the Dataframe row by row, as required by the `constant_memory` mode
+
+    The rows are taken `chunksize` at a time and the NA cells are skipped when
+    writing, so no copy of the whole column is ever made.
+    """
+    set_columns(sheet, len(df.columns), col_fmts, widths)
+    for j, value in enumerate(df.columns.values):
+        sheet.write(0, j, value, head_fmt)
+    for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start : start + chunksize]
+        na = chunk.isna().to_numpy()
+        for i, row in enumerate(chunk.itertuples(index=False, name=None)):
+            # xlsxwriter doesn't support writting NA directly
+            for j, value in enumerate(row):
+                if not na[i, j]:
+                    sheet.write(start + i + 1, j, value)
+
+
+def arrow_source(x: Arrow_DF) -> tuple[pa.Table, Iterable[pa.RecordBatch]]:
+    """the table to detect the formats from and the batches to be written
+
+    A reader or an iterator of the batches can only be read once, so the formats
+    are detected from its first batch.
+    """
+    if pa is None:
+        raise ImportError(f"pyarrow is required to write {type(x)}")
+    if pl is not None and isinstance(x, pl.DataFrame):
+        x = x.to_arrow()
+    if isinstance(x, pa.RecordBatch):
+        x = pa.Table.from_batches([x])
+    if isinstance(x, pa.Table):
+        return x, x.to_batches(max_chunksize=CHUNK_ROWS)
+    it = iter(x)
+    first = next(it, None)
+    if first is None:
+        schema = x.schema if isinstance(x, pa.RecordBatchReader) else pa.schema([])
+        return schema.empty_table(), []
+    if not isinstance(first, pa.RecordBatch):
+        raise TypeError(f"the batches must be RecordBatch, but find {type(first)}")
+    return pa.Table.from_batches([first]), itertools.chain([first], it)
+
+
+def batch_values(batch: pa.RecordBatch) -> list[list]:
+    """the Python values of each column, with the nulls and NaNs as None"""
+    out = []
+    for x in batch.columns:
+        if pa.types.is_floating(x.type):
+            x = pc.if_else(pc.is_nan(x), None, x)
+        out.append(x.to_pylist())
+    return out
+
+
+def sheet_name(name: str, i: int) -> str:
+    """the name of the i-th (from 0) sheet of the Dataframe `name`"""
+    suffix = "" if i == 0 else f"_{i + 1}"
+    return name[: SHEET_NAME_LEN - len(suffix)] + suffix
+
+
+def split_sheet(name: str, nrows: int, max_rows: int) -> list[SheetPart]:
+    """split the rows into consecutive sheets, e.g., `Sheet1`, `Sheet1_2`, ..."""
+    out = []
+    for i, start in enumerate(range(0, max(nrows, 1), max_rows)):
+        stop = min(start + max_rows, nrows)
+        out.append(SheetPart(name, sheet_name(name, i), start, stop))
+    return out
+
+
+def frame_rows(x: Frame) -> Optional[int]:
+    """the number of rows, None for a reader or an iterator of the batches"""
+    if isinstance(x, pd.DataFrame):
+        return len(x)
+    if pl is not None and isinstance(x, pl.DataFrame):
+        return x.height
+    if pa is not None and isinstance(x, (pa.Table, pa.RecordBatch)):
+        return x.num_rows
+    return None
+
+
+def check_sheet_names(x: Dict_DF, max_rows: int) -> None:
+    """raise if a split sheet (e.g., `表1_2`) would take the name of another sheet
+
+    The number of the sheets of a reader or an iterator is unknown before it's
+    read, so any name like its split sheets is regarded as a collision. Excel
+    sheet names are case-insensitive.
+    """
+    taken: dict[str, str] = {}
+    unknown = []
+    for nm, df in x.items():
+        n = frame_rows(df)
+        if n is None:
+            unknown.append(nm)
+            names = [sheet_name(nm, 0)]
+        else:
+            names = [part.sheet for part in split_sheet(nm, n, max_rows)]
+        for sheet in names:
+            if (other := taken.get(sheet.lower())) is not None:
+                raise ValueError(f"the sheet {sheet} of {nm} is taken by {other}")
+            taken[sheet.lower()] = nm
+    for nm in unknown:
+        for key, other in taken.items():
+            _, sep, i = key.rpartition("_")
+            if sep and i.isdigit() and int(i) > 1:
+                if key == sheet_name(nm, int(i) - 1).lower() and other != nm:
+                    raise ValueError(f"the sheet {key} of {other} may be taken by {nm}")
+
+
+def write_batches(
+    wb: xw.Workbook,
+    name: str,
+    columns: list[str],
+    batches: Iterable[pa.RecordBatch],
+    head_fmt: Optional[Wb_Format],
+    col_fmts: Optional[list[Wb_Format]],
+    widths: Optional[list[int]],
+    row_major: bool,
+    max_rows: int,
+) -> list[SheetPart]:
+    """write the Arrow batches to the sheets of `name`, starting a new sheet
+    every `max_rows` rows
+
+    Only one batch at a time is converted to the Python values. `row_major` must be
+    True in the `constant_memory` mode.
+    """
+    parts: list[SheetPart] = []
+    sheet = wb.add_worksheet(sheet_name(name, 0))
+    set_columns(sheet, len(columns), col_fmts, widths)
+    for j, value in enumerate(columns):
+        sheet.write(0, j, value, head_fmt)
+    start, nrows = 0, 0  # the first row of the current sheet and the rows written
+    for batch in batches:
+        if not isinstance(batch, pa.RecordBatch):
+            raise TypeError(f"the batches must be RecordBatch, but find {type(batch)}")
+        offset = 0
+        while offset < batch.num_rows:
+            if nrows - start == max_rows:
+                parts.append(SheetPart(name, sheet.name, start, nrows))
+                sheet = wb.add_worksheet(sheet_name(name, len(parts)))
+                set_columns(sheet, len(columns), col_fmts, widths)
+                for j, value in enumerate(columns):
+                    sheet.write(0, j, value, head_fmt)
+                start = nrows
+            n = min(batch.num_rows - offset, max_rows - (nrows - start))
+            values = batch_values(batch.slice(offset, n))
+            row = nrows - start + 1
+            if row_major:
+                for i, cells in enumerate(zip(*values)):
+                    for j, value in enumerate(cells):
+                        if value is not None:
+                            sheet.write(row + i, j, value)
+            else:
+                for j, x in enumerate(values):
+                    sheet.write_column(row, j, x)
+            offset += n
+            nrows += n
+    parts.append(SheetPart(name, sheet.name, start, nrows))
+    return parts
 
 
 def write(
-    df: pd.DataFrame | Dict_DF | tuple[pd.DataFrame] | list[pd.DataFrame],
+    df: Frame | Dict_DF | tuple[Frame] | list[Frame],
     path: str | Path,
     /,
-    #   comma: Optional[list[str]] = None, percent: Optional[list[str]] = None,
     overwrite: bool = False,
     open: bool = False,
+    streaming: bool = False,
+    autofit: bool = True,
+    max_rows: int = EXCEL_MAX_ROWS - 1,
+    *,
+    comma: Optional[list[str]] = None,
+    percent: Optional[list[str]] = None,
+    num_formats: Optional[dict[str, str]] = None,
+    manifest: Optional[Manifest] = None,
 ) -> Path:
+    """write the Dataframe(s) to the xlsx file
+
+    The number format of each column is detected from the dtype: dates, datetimes
+    and thousands separators for large floats (the integers need `comma`).
+
+    Besides pandas, the polars Dataframe, the Arrow table and the iterable of
+    Arrow RecordBatch (e.g., a `RecordBatchReader`) are written batch by batch
+    straight from the Arrow buffers, without a pandas copy.
+
+    Args:
+        streaming (bool, optional): use the `constant_memory` mode of xlsxwriter
+        that flushes each row to the disk once written. The memory usage no longer
+        grows with the number of rows, which matters for the exports of hundreds of
+        thousands of rows. Defaults to False.
+        autofit (bool, optional): fit the column widths to the contents, where the
+        CJK chars count as 2. Only a bounded sample of each text column and its
+        longest strings are measured, so it's cheap on large frames. Otherwise all
+        the widths are 12.
+        Defaults to True.
+        max_rows (int, optional): the max number of rows in a sheet. A larger
+        Dataframe is split into consecutive sheets like `Sheet1`, `Sheet1_2`, ...,
+        each with the header. Defaults to the Excel limit.
+        comma (list[str], optional): keyword-only, the columns formatted as
+        `#,##0.00`.
+        percent (list[str], optional): keyword-only, the columns formatted as
+        `0.00%`, i.e., the values are the ratios like 0.05.
+        num_formats (dict[str, str], optional): keyword-only, the Excel number
+        format of the columns, which takes precedence over the others.
+        manifest (Manifest, optional): keyword-only, the written sheets and their
+        row ranges are appended to it.
+
+    Raises:
+        ValueError: when a split sheet would take the name of another sheet, it's
+        checked before anything is written
+
+    Returns:
+        Path: the xlsx file
+    """
     if isinstance(path, str):
         filepath = Path(path).expanduser()
     else:
@@ -121,15 +658,44 @@ def write(
     if filepath.exists() and not overwrite:
         raise FileExistsError(f"{path} already exists")
     x = make_dict(df)
+    check_sheet_names(x, max_rows)
+    if manifest is None:
+        manifest = Manifest()
 
-    with xw.Workbook(filepath, {"default_date_format": "yyyy-mm-dd"}) as wb:
-        head_fmt = wb.add_format(style_fmts["header"])
-        # TODO: when applied cell_fmt, the default date_format will be replaced
-        # we need to find a way to know the cell type is date and set the format
-        # cell_fmt = wb.add_format(style_fmts["cell"])
+    # no default_date_format, or it replaces the column formats of the dates
+    with xw.Workbook(filepath, {"constant_memory": streaming}) as wb:
+        fmts = FormatCache(wb)
+        head_fmt = fmts.get(style_fmts["header"] or {})
         for nm, df in x.items():
-            ws = wb.add_worksheet(nm)
-            write_df(df, ws, head_fmt, None)
+            if not isinstance(df, pd.DataFrame):
+                tbl, batches = arrow_source(df)
+                col_num_fmts = arrow_num_fmts(tbl, comma, percent, num_formats)
+                col_fmts = column_fmts(col_num_fmts, fmts)
+                widths = arrow_fit_widths(tbl, col_num_fmts) if autofit else None
+                manifest.parts += write_batches(
+                    wb,
+                    nm,
+                    tbl.column_names,
+                    batches,
+                    head_fmt,
+                    col_fmts,
+                    widths,
+                    streaming,
+                    max_rows,
+                )
+                continue
+            # the parts share the formats and the widths of the whole Dataframe
+            col_num_fmts = column_num_fmts(df, comma, percent, num_formats)
+            col_fmts = column_fmts(col_num_fmts, fmts)
+            widths = fit_widths(df, col_num_fmts) if autofit else None
+            for part in split_sheet(nm, len(df), max_rows):
+                ws = wb.add_worksheet(part.sheet)
+                rows = df.iloc[part.start : part.stop]
+                if streaming:
+                    write_df_rows(rows, ws, head_fmt, col_fmts, widths)
+                else:
+                    write_df(rows, ws, head_fmt, col_fmts, widths)
+                manifest.parts.append(part)
 
     if open:
         subprocess.run(["open", str(filepath)])